@@ -1,27 +1,378 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-import sqlite3, os, re
+from flask import Flask, Blueprint, render_template, request, redirect, url_for, session, flash, g, jsonify, has_request_context, Response, stream_with_context
+import sqlite3, os, re, hmac, hashlib, uuid, gzip, json, time
+from collections import deque
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
+from db import ConnectionPool, transaction
+from images import ImagePipeline, CONTENT_ADDRESSED, VARIANTS as IMAGE_VARIANTS, store_upload
+try:
+    import brotli
+except ImportError:  # in requirements.txt; without it the API falls back to gzip
+    brotli = None
+from cache import TTLCache
+from events import EventHub, TooManySubscribers, format_event
+from metrics import Registry, SIZE_BUCKETS, QUERY_COUNT_BUCKETS
+from profiling import NPlusOneError, call_site, explain, repeated_statements
+import seed
+import bench
+import importer
+import exporter
+import jobs
+import notifications
+import dispatch
+import inventory
+from migrations import apply_migrations, current_version, unindexed_queries
+import click
 
 # -------------------- Flask Setup --------------------
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
 UPLOAD_FOLDER = 'static/uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['IMAGE_WORKERS'] = 2
+app.config['DATABASE'] = os.environ.get('DATABASE', 'food_ordering.db')  # point at a copy for seeding/benchmarks
+app.config['DB_POOL_SIZE'] = 8
+app.config['DASHBOARD_PAGE_SIZE'] = 24
+app.config['ORDER_HISTORY_PAGE_SIZE'] = 20
+app.config['SEARCH_PAGE_SIZE'] = 20
+app.config['REVIEWS_PAGE_SIZE'] = 10
+app.config['SEARCH_MAX_PAGES'] = 50
+app.config['CATALOG_CACHE_SIZE'] = 1024
+app.config['CATALOG_CACHE_TTL'] = 300  # seconds; also bounds staleness across worker processes
+app.config['API_PAGE_SIZE'] = 50
+app.config['API_MAX_PAGE_SIZE'] = 200
+app.config['API_COMPRESS_MIN_SIZE'] = 500  # bytes; smaller bodies go out uncompressed
+app.config['CART_SUMMARY_CACHE_SIZE'] = 10000
+app.config['CART_SUMMARY_CACHE_TTL'] = 60
+app.config['SLOW_REQUEST_SECONDS'] = 0.5  # requests slower than this are logged with their SQL
+app.config['SLOW_REQUEST_LOG_SIZE'] = 100
+# Query profiling (development/staging): slow statements are logged with their
+# plan and requests repeating a statement shape are flagged as N+1. Tests can set
+# N_PLUS_ONE_RAISE so an offending request raises NPlusOneError instead.
+app.config['QUERY_PROFILING'] = os.environ.get('QUERY_PROFILING') == '1'
+app.config['SLOW_QUERY_SECONDS'] = 0.05
+app.config['N_PLUS_ONE_THRESHOLD'] = 10  # same statement shape more than this per request
+app.config['N_PLUS_ONE_RAISE'] = False
+app.config['IMPORT_BATCH_SIZE'] = 1000  # rows per executemany transaction in bulk imports
+app.config['EXPORT_CHUNK_SIZE'] = 500  # orders fetched per query when exporting
+app.config['SSE_MAX_SUBSCRIBERS'] = 100  # open order event streams per worker process
+app.config['SSE_HEARTBEAT_SECONDS'] = 15
+app.config['SSE_RETRY_MS'] = 3000  # client reconnect delay
+# Background jobs run on threads inside each web process unless this is 0, in
+# which case start dedicated workers with `flask worker`.
+app.config['JOB_WORKER_THREADS'] = int(os.environ.get('JOB_WORKER_THREADS', 1))
+app.config['JOB_POLL_SECONDS'] = 1.0
+app.config['JOB_VISIBILITY_TIMEOUT'] = 60  # seconds before a claimed job is handed to another worker
+app.config['JOB_MAX_ATTEMPTS'] = 5
+app.config['NOTIFY_BATCH_SIZE'] = 500  # buffered notifications written per executemany
+app.config['NOTIFY_FLUSH_SECONDS'] = 1.0  # longest a buffered notification waits to be written
+app.config['BROADCAST_CHUNK_SIZE'] = 1000  # users notified per write transaction in a broadcast
+app.config['NOTIFICATIONS_PAGE_SIZE'] = 20
+app.config['DISPATCH_INTERVAL_SECONDS'] = float(os.environ.get('DISPATCH_INTERVAL_SECONDS', 5))  # 0: only 'flask dispatch'
+app.config['DISPATCH_BATCH_SIZE'] = 10000  # deliveries considered per batch
+app.config['DISPATCH_CELL_KM'] = 2.0  # spatial grid cell size
+app.config['DISPATCH_MAX_KM'] = 15.0  # drivers further than this from the restaurant are not considered
+app.config['DRIVER_SPEED_KMH'] = 25.0
+app.config['PREP_MINUTES'] = 15
+app.config['UPLOAD_GC_GRACE_HOURS'] = 24  # unreferenced uploads younger than this are kept
+# Changing this key invalidates every stored password fingerprint
+app.config['PASSWORD_FINGERPRINT_KEY'] = os.environ.get('PASSWORD_FINGERPRINT_KEY', app.secret_key)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# -------------------- Image Pipeline --------------------
+# Uploads are saved as-is on the request thread; resized/WebP variants are built
+# in the background and templates switch to them (srcset) once they exist.
+image_pipeline = ImagePipeline(UPLOAD_FOLDER, max_workers=app.config['IMAGE_WORKERS'])
+
+def save_upload(image):
+    ext = os.path.splitext(secure_filename(image.filename))[1]
+    filename, size, created = store_upload(image.stream, app.config['UPLOAD_FOLDER'], ext)
+    # Registered (or re-stamped) in its own transaction so the GC grace period
+    # covers the window before the row referencing it is written.
+    conn = get_db_connection()
+    with transaction(conn):
+        conn.execute('''
+            INSERT INTO uploads (filename, size, created_at) VALUES (?, ?, ?)
+            ON CONFLICT(filename) DO UPDATE SET created_at = excluded.created_at
+        ''', (filename, size, datetime.now().isoformat(timespec='seconds')))
+    if created or image_pipeline.variants(filename) is None:
+        image_pipeline.submit(filename)
+    return filename
+
+@app.after_request
+def cache_uploads_forever(response):
+    # Content-addressed names never change meaning, so browsers needn't revalidate
+    if request.endpoint == 'static' and response.status_code == 200:
+        path = request.view_args.get('filename', '')
+        if path.startswith('uploads/') and CONTENT_ADDRESSED.match(path[len('uploads/'):]):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = 365 * 24 * 3600
+            response.cache_control.immutable = True
+    return response
+
+@app.template_global()
+def image_srcsets(filename):
+    """Return {'webp': srcset, 'fallback': srcset} for a processed upload, or None."""
+    variants = image_pipeline.variants(filename)
+    if variants is None:
+        return None
+    def srcset(names):
+        return ', '.join(f"{url_for('static', filename='uploads/' + name)} {width}w" for name, width in names)
+    return {'webp': srcset(variants['webp']), 'fallback': srcset(variants['fallback']) if variants['fallback'] else None}
+
+@app.cli.command('process-images')
+def process_images_command():
+    """Build resized and WebP variants for every existing upload."""
+    variant_suffixes = tuple(f'.{variant}' for variant, _ in IMAGE_VARIANTS)
+    originals = [name for name in sorted(os.listdir(app.config['UPLOAD_FOLDER']))
+                 if not os.path.splitext(name)[0].endswith(variant_suffixes) and not name.endswith('.tmp')]
+    futures = [image_pipeline.submit(name) for name in originals]
+    done = sum(1 for future in futures if future.result())
+    click.echo(f'Processed {done} of {len(originals)} uploads.')
+
+@app.cli.command('gc-uploads')
+@click.option('--dry-run', is_flag=True, help='List unreferenced uploads without deleting them.')
+def gc_uploads_command(dry_run):
+    """Delete content-addressed uploads no menu item or user refers to."""
+    cutoff = (datetime.now() - timedelta(hours=app.config['UPLOAD_GC_GRACE_HOURS'])).isoformat(timespec='seconds')
+    conn = get_db_connection()
+    if dry_run:
+        rows = conn.execute('SELECT filename, size FROM uploads WHERE ref_count = 0 AND created_at < ?', (cutoff,)).fetchall()
+    else:
+        with transaction(conn):
+            rows = conn.execute('DELETE FROM uploads WHERE ref_count = 0 AND created_at < ? RETURNING filename, size',
+                                (cutoff,)).fetchall()
+    for row in rows:
+        click.echo(row['filename'])
+        if dry_run:
+            continue
+        try:
+            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], row['filename']))
+        except FileNotFoundError:
+            pass
+        image_pipeline.discard(row['filename'])
+    verb = 'Would delete' if dry_run else 'Deleted'
+    click.echo(f'{verb} {len(rows)} unreferenced uploads ({sum(row["size"] for row in rows)} bytes).')
+
 # -------------------- Database Helper --------------------
+def get_db_pool():
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        pool = ConnectionPool(app.config['DATABASE'], max_size=app.config['DB_POOL_SIZE'],
+                              observer=record_statement)
+        app.extensions['db_pool'] = pool
+    return pool
+
 def get_db_connection():
-    conn = sqlite3.connect('food_ordering.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    # One pooled connection per app context, handed back in close_db_connection()
+    if 'db' not in g:
+        g.db = get_db_pool().acquire()
+    return g.db
+
+@app.teardown_appcontext
+def close_db_connection(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_db_pool().release(conn)
+
+# -------------------- Background Jobs --------------------
+job_worker = jobs.Worker(get_db_pool, threads=app.config['JOB_WORKER_THREADS'],
+                         poll_interval=app.config['JOB_POLL_SECONDS'],
+                         visibility_timeout=app.config['JOB_VISIBILITY_TIMEOUT'])
+
+@app.before_request
+def start_job_worker():
+    job_worker.ensure_started()
+
+@app.cli.command('worker')
+@click.option('--threads', default=2, show_default=True)
+def worker_command(threads):
+    """Process background jobs until interrupted."""
+    job_worker.threads = threads
+    job_worker.ensure_started()
+    click.echo(f'Job worker running with {threads} threads; Ctrl-C to stop.')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        job_worker.stop(timeout=job_worker.visibility_timeout)
+
+@app.cli.command('jobs')
+@click.option('--requeue-dead', 'requeue', is_flag=True, help='Retry every dead-lettered job.')
+def jobs_command(requeue):
+    """Show queue depth and dead-lettered jobs."""
+    conn = get_db_connection()
+    if requeue:
+        click.echo(f'Requeued {jobs.requeue_dead(conn)} dead jobs.')
+    click.echo(json.dumps(jobs.queue_stats(conn)))
+    for row in get_dead_jobs(conn):
+        click.echo(f"dead #{row['job_id']} {row['name']} {row['payload']} after {row['attempts']} attempts: "
+                   f"{(row['last_error'] or '').strip().splitlines()[-1:]}")
+
+def get_dead_jobs(conn, limit=50):
+    return conn.execute('''
+        SELECT job_id, name, payload, attempts, last_error, created_at FROM jobs
+        WHERE status = 'dead' ORDER BY job_id DESC LIMIT ?
+    ''', (limit,)).fetchall()
+
+# -------------------- Request Metrics --------------------
+# Per-endpoint latency, response size and SQL counts, scraped from /admin/metrics.
+# Numbers are per worker process.
+metrics = Registry()
+request_duration = metrics.histogram('http_request_duration_seconds', 'Time spent handling a request.',
+                                     ('endpoint', 'method'))
+requests_total = metrics.counter('http_requests_total', 'Requests handled.', ('endpoint', 'method', 'status'))
+response_size = metrics.histogram('http_response_size_bytes', 'Response body size.', ('endpoint',), SIZE_BUCKETS)
+sql_per_request = metrics.histogram('sql_statements_per_request', 'SQL statements executed per request.',
+                                    ('endpoint',), QUERY_COUNT_BUCKETS)
+sql_seconds = metrics.counter('sql_statement_seconds_total', 'Time spent executing SQL statements.', ('endpoint',))
+slow_requests = deque(maxlen=app.config['SLOW_REQUEST_LOG_SIZE'])
+
+def record_statement(conn, sql, parameters, seconds):
+    sql = ' '.join(sql.split())
+    site = None
+    if app.config['QUERY_PROFILING']:
+        site = call_site(1)
+        if seconds >= app.config['SLOW_QUERY_SECONDS']:
+            plan = explain(conn, sql, parameters) if parameters is not None else []
+            app.logger.warning('Slow query (%.1fms) at %s: %s\n%s', seconds * 1000, site, sql,
+                               '\n'.join(f'  {detail}' for detail in plan) or '  (no plan)')
+    if has_request_context() and 'sql_log' in g:
+        g.sql_log.append((sql, seconds, site))
+
+def check_n_plus_one(endpoint):
+    repeats = repeated_statements(((sql, site) for sql, _, site in g.sql_log), app.config['N_PLUS_ONE_THRESHOLD'])
+    if not repeats:
+        return
+    message = '\n'.join(f'{endpoint}: {count}x {sql}\n  from {", ".join(sites)}' for sql, count, sites in repeats)
+    app.logger.warning('Possible N+1 queries in %s %s:\n%s', request.method, request.path, message)
+    if app.config['N_PLUS_ONE_RAISE']:
+        raise NPlusOneError(message)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.sql_log = []
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unmatched'
+    request_duration.observe(elapsed, endpoint, request.method)
+    requests_total.inc(endpoint, request.method, str(response.status_code))
+    if response.content_length is not None:
+        response_size.observe(response.content_length, endpoint)
+    sql_per_request.observe(len(g.sql_log), endpoint)
+    sql_seconds.inc(endpoint, amount=sum(seconds for _, seconds, _ in g.sql_log))
+
+    if elapsed >= app.config['SLOW_REQUEST_SECONDS']:
+        entry = {
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'seconds': round(elapsed, 4),
+            'statements': [{'sql': sql, 'seconds': round(seconds, 6)} for sql, seconds, _ in g.sql_log],
+        }
+        slow_requests.append(entry)
+        app.logger.warning('Slow request %s %s took %.3fs with %d statements:\n%s', request.method, entry['path'],
+                           elapsed, len(g.sql_log),
+                           '\n'.join(f'  {seconds * 1000:8.2f}ms  {sql}' for sql, seconds, _ in g.sql_log))
+
+    if app.config['QUERY_PROFILING']:
+        check_n_plus_one(endpoint)
+    return response
+
+# -------------------- Catalog Cache --------------------
+# Catalog reads are served from memory; admin writes call invalidate_catalog().
+# Entries are keyed by the catalog version read once per request, so data cached
+# before another worker's write is never served alongside the newer version's ETag.
+catalog_cache = TTLCache(app.config['CATALOG_CACHE_SIZE'], app.config['CATALOG_CACHE_TTL'])
+
+def get_catalog_version():
+    if 'catalog_version' not in g:
+        g.catalog_version = catalog_cache.get_or_load('catalog_version', lambda: get_db_connection().execute(
+            'SELECT version FROM catalog_version WHERE id = 1').fetchone()[0])
+    return g.catalog_version
+
+def catalog_key(*parts):
+    return (get_catalog_version(),) + parts
+
+def invalidate_catalog():
+    catalog_cache.invalidate()
+    cart_summary_cache.invalidate()  # cart subtotals depend on menu prices
+
+PRODUCT_QUERY = '''
+    SELECT menu_items.*, categories.name AS category_name, restaurants.name AS restaurant_name
+    FROM menu_items
+    JOIN categories ON menu_items.category_id = categories.category_id
+    JOIN restaurants ON menu_items.restaurant_id = restaurants.restaurant_id
+'''
 
 def get_all_categories():
-    conn = get_db_connection()
-    categories = conn.execute("SELECT category_id, name FROM categories").fetchall()
-    conn.close()
-    return categories
+    return catalog_cache.get_or_load(catalog_key('categories'), lambda: get_db_connection().execute(
+        "SELECT category_id, name FROM categories").fetchall())
+
+def get_all_restaurants():
+    return catalog_cache.get_or_load(catalog_key('restaurants'), lambda: get_db_connection().execute(
+        "SELECT * FROM restaurants").fetchall())
+
+def get_all_products():
+    return catalog_cache.get_or_load(catalog_key('products'), lambda: get_db_connection().execute(
+        PRODUCT_QUERY).fetchall())
+
+def get_product(item_id):
+    return catalog_cache.get_or_load(catalog_key('product', item_id), lambda: get_db_connection().execute(
+        PRODUCT_QUERY + ' WHERE item_id = ?', (item_id,)).fetchone())
+
+def get_product_page(category_ids=(), restaurant_ids=(), min_price=None, max_price=None, after_id=0, limit=24):
+    # Keyset pagination on item_id: each page starts where the last one ended, no OFFSET scan
+    clauses, params = ['menu_items.item_id > ?'], [after_id or 0]
+    if category_ids:
+        clauses.append(f"menu_items.category_id IN ({', '.join('?' * len(category_ids))})")
+        params.extend(category_ids)
+    if restaurant_ids:
+        clauses.append(f"menu_items.restaurant_id IN ({', '.join('?' * len(restaurant_ids))})")
+        params.extend(restaurant_ids)
+    if min_price is not None:
+        clauses.append('menu_items.price >= ?')
+        params.append(min_price)
+    if max_price is not None:
+        clauses.append('menu_items.price <= ?')
+        params.append(max_price)
+    sql = PRODUCT_QUERY + ' WHERE ' + ' AND '.join(clauses) + ' ORDER BY menu_items.item_id LIMIT ?'
+
+    def load():
+        rows = get_db_connection().execute(sql, params + [limit + 1]).fetchall()
+        next_cursor = rows[limit - 1]['item_id'] if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    key = catalog_key('page', tuple(category_ids), tuple(restaurant_ids), min_price, max_price, after_id, limit)
+    return catalog_cache.get_or_load(key, load)
+
+# -------------------- Password Fingerprints --------------------
+def password_fingerprint(password):
+    key = app.config['PASSWORD_FINGERPRINT_KEY'].encode()
+    return hmac.new(key, password.encode(), hashlib.sha256).hexdigest()
+
+def password_in_use(conn, password):
+    if conn.execute("SELECT 1 FROM users WHERE password_fingerprint = ? LIMIT 1",
+                    (password_fingerprint(password),)).fetchone():
+        return True
+    # Accounts not yet backfilled still need the slow hash check; this set shrinks as they log in
+    legacy = conn.execute("SELECT password FROM users WHERE password_fingerprint IS NULL").fetchall()
+    return any(check_password_hash(row['password'], password) for row in legacy)
+
+def backfill_password_fingerprint(conn, user, password):
+    if user['password_fingerprint'] is None:
+        conn.execute("UPDATE users SET password_fingerprint = ? WHERE user_id = ?",
+                     (password_fingerprint(password), user['user_id']))
+        conn.commit()
 
 # -------------------- Initialize Database --------------------
 def init_db():
@@ -176,7 +527,378 @@ def init_db():
         print("✅ Default admin created: admin@example.com / admin123!")
 
     conn.commit()
-    conn.close()
+    apply_migrations(conn)
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Create missing tables and apply pending schema migrations."""
+    init_db()
+    click.echo(f'Schema at version {current_version(get_db_connection())}')
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """Fail if any filtered query in app.py needs a full table scan, or can't be checked."""
+    problems = unindexed_queries(get_db_connection(), __file__)
+    for lineno, sql, scans in problems:
+        click.echo(f'app.py:{lineno}: {"; ".join(scans)}' + (f'\n    {sql}' if sql else ''))
+    if problems:
+        raise SystemExit(1)
+    click.echo('All filtered queries use an index.')
+
+# -------------------- Menu Search --------------------
+def build_search_query(text):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'  # type-ahead: 'chick' matches 'chicken'
+    return ' '.join(terms)
+
+def search_menu(conn, text, page=1, per_page=20):
+    """Return (rows, has_more) for one page of bm25-ranked matches."""
+    fts_query = build_search_query(text)
+    if fts_query is None:
+        return [], False
+    # FTS5 computes the top-k by rank itself; OFFSET is bounded by SEARCH_MAX_PAGES
+    rows = conn.execute('''
+        SELECT m.*, c.name AS category_name, r.name AS restaurant_name, s.rank
+        FROM (
+            SELECT rowid, rank FROM menu_search
+            WHERE menu_search MATCH ?
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+        ) s
+        JOIN menu_items m ON m.item_id = s.rowid
+        JOIN categories c ON m.category_id = c.category_id
+        JOIN restaurants r ON m.restaurant_id = r.restaurant_id
+        ORDER BY s.rank
+    ''', (fts_query, per_page + 1, (page - 1) * per_page)).fetchall()
+    return rows[:per_page], len(rows) > per_page
+
+# -------------------- Cart Summary --------------------
+# Item count and subtotal per user, for the header badge only: the cache is per
+# process and may trail a price edit made in another worker, so pages that show
+# what the user will be charged (cart, checkout) total the cart themselves.
+# Every cart mutation must call invalidate_cart_summary() after committing.
+cart_summary_cache = TTLCache(app.config['CART_SUMMARY_CACHE_SIZE'], app.config['CART_SUMMARY_CACHE_TTL'])
+
+def get_cart_summary(user_id):
+    def load():
+        row = get_db_connection().execute('''
+            SELECT COALESCE(SUM(c.quantity), 0) AS item_count, COALESCE(SUM(c.quantity * m.price), 0) AS subtotal
+            FROM cart c JOIN menu_items m ON c.item_id = m.item_id
+            WHERE c.user_id = ?
+        ''', (user_id,)).fetchone()
+        return {'item_count': row['item_count'], 'subtotal': row['subtotal']}
+    return cart_summary_cache.get_or_load(user_id, load)
+
+def invalidate_cart_summary(user_id):
+    cart_summary_cache.discard(user_id)
+
+# -------------------- Review Aggregates --------------------
+# review_stats holds one row per reviewed item; leave_review keeps it current
+def get_rating_summaries(conn, item_ids):
+    """Map item_id -> {'count', 'average'} for the given items (PK lookups, not cached)."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return {}
+    rows = conn.execute(f'''
+        SELECT item_id, rating_count, rating_sum FROM review_stats
+        WHERE item_id IN ({', '.join('?' * len(item_ids))}) AND rating_count > 0
+    ''', item_ids).fetchall()
+    return {row['item_id']: {'count': row['rating_count'],
+                             'average': round(row['rating_sum'] / row['rating_count'], 1)} for row in rows}
+
+def get_review_stats(conn, item_id):
+    row = conn.execute('SELECT * FROM review_stats WHERE item_id = ?', (item_id,)).fetchone()
+    if not row or not row['rating_count']:
+        return None
+    return {
+        'count': row['rating_count'],
+        'average': round(row['rating_sum'] / row['rating_count'], 1),
+        'histogram': {stars: row[f'stars_{stars}'] for stars in range(5, 0, -1)},
+    }
+
+def record_review_rating(conn, item_id, new_rating, old_rating=None):
+    """Fold a new review, or a changed rating on an existing one, into review_stats.
+
+    Each bucket moves by (rating = n), as in the backfill, so both cases are one
+    fixed statement whatever the ratings are.
+    """
+    if old_rating is None:
+        conn.execute('''
+            INSERT INTO review_stats (item_id, rating_count, rating_sum, stars_1, stars_2, stars_3, stars_4, stars_5)
+            VALUES (:item_id, 1, :new, :new = 1, :new = 2, :new = 3, :new = 4, :new = 5)
+            ON CONFLICT (item_id) DO UPDATE SET
+                rating_count = rating_count + 1,
+                rating_sum = rating_sum + excluded.rating_sum,
+                stars_1 = stars_1 + excluded.stars_1,
+                stars_2 = stars_2 + excluded.stars_2,
+                stars_3 = stars_3 + excluded.stars_3,
+                stars_4 = stars_4 + excluded.stars_4,
+                stars_5 = stars_5 + excluded.stars_5
+        ''', {'item_id': item_id, 'new': new_rating})
+    elif old_rating != new_rating:
+        # Count is unchanged; move one vote between histogram buckets
+        conn.execute('''
+            UPDATE review_stats SET
+                rating_sum = rating_sum + :new - :old,
+                stars_1 = stars_1 + (:new = 1) - (:old = 1),
+                stars_2 = stars_2 + (:new = 2) - (:old = 2),
+                stars_3 = stars_3 + (:new = 3) - (:old = 3),
+                stars_4 = stars_4 + (:new = 4) - (:old = 4),
+                stars_5 = stars_5 + (:new = 5) - (:old = 5)
+            WHERE item_id = :item_id
+        ''', {'item_id': item_id, 'new': new_rating, 'old': old_rating})
+
+# -------------------- Statistics --------------------
+# Counters in the stats table are kept current by triggers (see migration 5);
+# these queries are only used to rebuild them and check for drift.
+STATS_QUERIES = {
+    'total_orders': 'SELECT COUNT(*) FROM orders',
+    'total_sales': 'SELECT COALESCE(SUM(total_amount), 0) FROM orders',
+    'total_products': 'SELECT COUNT(*) FROM menu_items',
+    'total_customers': "SELECT COUNT(*) FROM users WHERE role = 'customer'",
+}
+
+def get_stats(conn):
+    return {row['name']: row['value'] for row in conn.execute('SELECT name, value FROM stats')}
+
+def rebuild_stats(conn, fix=True):
+    """Recompute every counter from scratch; returns {name: (stored, actual)} for those that drifted."""
+    drift = {}
+    with transaction(conn):
+        stored = get_stats(conn)
+        for name, sql in STATS_QUERIES.items():
+            actual = conn.execute(sql).fetchone()[0]
+            if stored.get(name) is None or abs(stored[name] - actual) > 1e-6:
+                drift[name] = (stored.get(name), actual)
+            if fix:
+                conn.execute('INSERT OR REPLACE INTO stats (name, value) VALUES (?, ?)', (name, actual))
+    return drift
+
+@app.cli.command('rebuild-stats')
+@click.option('--check', is_flag=True, help='Only report drift; exit 1 if any counter is off.')
+def rebuild_stats_command(check):
+    """Recompute the admin overview counters and report drift."""
+    drift = rebuild_stats(get_db_connection(), fix=not check)
+    for name, (stored, actual) in drift.items():
+        click.echo(f'{name}: stored {stored}, actual {actual}')
+    if not drift:
+        click.echo('Counters match.')
+    elif check:
+        raise SystemExit(1)
+
+# -------------------- Sales Rollups --------------------
+# Each order is folded into hour and day buckets when it is placed, so analytics
+# never scan orders/order_details. Buckets are the leading part of order_date.
+# restaurant_id 0 holds the all-restaurants total (an order spanning two
+# restaurants counts once there, once for each restaurant otherwise).
+ALL_RESTAURANTS = 0
+ROLLUP_GRANULARITIES = {'hour': 13, 'day': 10}  # prefix length of 'YYYY-MM-DD HH:MM:SS'
+
+def rollup_bucket(order_date, granularity):
+    prefix = order_date[:ROLLUP_GRANULARITIES[granularity]]
+    return prefix + ':00:00' if granularity == 'hour' else prefix
+
+def fold_order_into_rollups(conn, order_date, lines):
+    """Add one order's lines (item_id, restaurant_id, quantity, subtotal) to every bucket."""
+    per_restaurant = {ALL_RESTAURANTS: [0, 0]}
+    for item_id, restaurant_id, quantity, subtotal in lines:
+        for key in (restaurant_id, ALL_RESTAURANTS):
+            totals = per_restaurant.setdefault(key, [0, 0])
+            totals[0] += quantity
+            totals[1] += subtotal
+
+    for granularity in ROLLUP_GRANULARITIES:
+        bucket = rollup_bucket(order_date, granularity)
+        conn.executemany('''
+            INSERT INTO restaurant_sales_rollup (granularity, bucket, restaurant_id, orders, items_sold, revenue)
+            VALUES (?, ?, ?, 1, ?, ?)
+            ON CONFLICT (granularity, bucket, restaurant_id) DO UPDATE SET
+                orders = orders + 1,
+                items_sold = items_sold + excluded.items_sold,
+                revenue = revenue + excluded.revenue
+        ''', [(granularity, bucket, rid, qty, revenue) for rid, (qty, revenue) in per_restaurant.items()])
+        conn.executemany('''
+            INSERT INTO item_sales_rollup (granularity, bucket, item_id, quantity, revenue)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (granularity, bucket, item_id) DO UPDATE SET
+                quantity = quantity + excluded.quantity,
+                revenue = revenue + excluded.revenue
+        ''', [(granularity, bucket, item_id, qty, subtotal) for item_id, _, qty, subtotal in lines])
+
+def backfill_rollups(conn, batch_size=1000):
+    """Rebuild all buckets from order history in short per-batch write transactions.
+
+    Orders placed while this runs are folded in live; only orders up to the
+    high-water mark taken at the start are replayed here.
+    """
+    with transaction(conn):
+        high_water = conn.execute('SELECT COALESCE(MAX(order_id), 0) FROM orders').fetchone()[0]
+        conn.execute('DELETE FROM restaurant_sales_rollup')
+        conn.execute('DELETE FROM item_sales_rollup')
+
+    last_id, replayed = 0, 0
+    while last_id < high_water:
+        upper = min(last_id + batch_size, high_water)
+        with transaction(conn):
+            for granularity, length in ROLLUP_GRANULARITIES.items():
+                bucket = 'substr(o.order_date, 1, ?)' + (" || ':00:00'" if granularity == 'hour' else '')
+                conn.execute(f'''
+                    INSERT INTO restaurant_sales_rollup (granularity, bucket, restaurant_id, orders, items_sold, revenue)
+                    SELECT ?, {bucket}, m.restaurant_id, COUNT(DISTINCT o.order_id),
+                           SUM(od.quantity), SUM(od.subtotal)
+                    FROM orders o
+                    JOIN order_details od ON od.order_id = o.order_id
+                    JOIN menu_items m ON m.item_id = od.item_id
+                    WHERE o.order_id > ? AND o.order_id <= ? AND o.order_date IS NOT NULL
+                    GROUP BY 2, 3
+                    UNION ALL
+                    SELECT ?, {bucket}, ?, COUNT(DISTINCT o.order_id), SUM(od.quantity), SUM(od.subtotal)
+                    FROM orders o
+                    JOIN order_details od ON od.order_id = o.order_id
+                    WHERE o.order_id > ? AND o.order_id <= ? AND o.order_date IS NOT NULL
+                    GROUP BY 2
+                    ON CONFLICT (granularity, bucket, restaurant_id) DO UPDATE SET
+                        orders = orders + excluded.orders,
+                        items_sold = items_sold + excluded.items_sold,
+                        revenue = revenue + excluded.revenue
+                ''', (granularity, length, last_id, upper,
+                      granularity, length, ALL_RESTAURANTS, last_id, upper))
+                conn.execute(f'''
+                    INSERT INTO item_sales_rollup (granularity, bucket, item_id, quantity, revenue)
+                    SELECT ?, {bucket}, od.item_id, SUM(od.quantity), SUM(od.subtotal)
+                    FROM orders o
+                    JOIN order_details od ON od.order_id = o.order_id
+                    WHERE o.order_id > ? AND o.order_id <= ? AND o.order_date IS NOT NULL
+                    GROUP BY 2, 3
+                    ON CONFLICT (granularity, bucket, item_id) DO UPDATE SET
+                        quantity = quantity + excluded.quantity,
+                        revenue = revenue + excluded.revenue
+                ''', (granularity, length, last_id, upper))
+            replayed += conn.execute('SELECT COUNT(*) FROM orders WHERE order_id > ? AND order_id <= ?',
+                                     (last_id, upper)).fetchone()[0]
+        last_id = upper
+    return replayed
+
+@app.cli.command('backfill-rollups')
+@click.option('--batch-size', default=1000, show_default=True, help='Orders replayed per transaction.')
+def backfill_rollups_command(batch_size):
+    """Rebuild the sales rollup buckets from existing orders."""
+    replayed = backfill_rollups(get_db_connection(), batch_size)
+    click.echo(f'Replayed {replayed} orders into sales rollups.')
+
+# -------------------- Synthetic Data & Benchmarks --------------------
+# Both write to DATABASE; run them against a scratch copy, e.g.
+#   DATABASE=/tmp/bench.db flask seed-data --scale medium && DATABASE=/tmp/bench.db flask bench
+@app.cli.command('seed-data')
+@click.option('--scale', type=click.Choice(list(seed.SCALES)), default='small', show_default=True)
+@click.option('--seed', 'rng_seed', default=42, show_default=True, help='Random seed; same seed, same data.')
+@click.option('--end-date', type=click.DateTime(['%Y-%m-%d']), help='Newest order date (default: today).')
+@click.option('--days', default=365, show_default=True, help='Days of order history.')
+@click.option('--batch-size', default=10000, show_default=True)
+@click.option('--restaurants', type=int)
+@click.option('--categories', type=int)
+@click.option('--menu-items', type=int)
+@click.option('--users', type=int)
+@click.option('--order-details', type=int)
+@click.option('--reviews', type=int)
+@click.option('--cart', type=int)
+@click.option('--drivers', type=int)
+def seed_data_command(scale, rng_seed, end_date, days, batch_size, **overrides):
+    """Fill the schema with reproducible synthetic data."""
+    init_db()
+    volumes = seed.SCALES[scale] | {name: count for name, count in overrides.items() if count is not None}
+    conn = get_db_connection()
+    started = time.perf_counter()
+    seed.generate(conn, volumes, generate_password_hash(seed.SEED_PASSWORD),
+                  password_fingerprint(seed.SEED_PASSWORD), seed=rng_seed, days=days, end=end_date,
+                  batch_size=batch_size, progress=click.echo)
+    backfill_rollups(conn)
+    click.echo(f'Seeded in {time.perf_counter() - started:.1f}s; users log in with {seed.SEED_PASSWORD!r}.')
+
+@app.cli.command('bench')
+@click.option('--route', 'routes', multiple=True, type=click.Choice(list(bench.SCENARIOS)),
+              help='Scenario to run (repeatable; default all).')
+@click.option('--requests', default=200, show_default=True, help='Measured requests per scenario.')
+@click.option('--concurrency', default=4, show_default=True, help='Concurrent test clients.')
+@click.option('--warmup', default=10, show_default=True)
+@click.option('--seed', 'rng_seed', default=42, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the JSON report here.')
+@click.option('--compare', 'baseline', type=click.File(), help='Earlier JSON report to diff against.')
+def bench_command(routes, requests, concurrency, warmup, rng_seed, output, baseline):
+    """Measure throughput and p50/p95/p99 latency per route."""
+    report = bench.run(app, get_db_connection(), routes, requests, concurrency, warmup, rng_seed,
+                       progress=click.echo)
+    if baseline:
+        for line in bench.compare(json.load(baseline), report):
+            click.echo(line)
+    if output:
+        bench.save(report, output)
+        click.echo(f'Saved {output}')
+
+def get_sales_series(conn, granularity, from_date, to_date, restaurant_id=None):
+    start, end = bucket_bounds(from_date, to_date)
+    return conn.execute('''
+        SELECT bucket, orders, items_sold, revenue
+        FROM restaurant_sales_rollup
+        WHERE granularity = ? AND bucket >= ? AND bucket < ? AND restaurant_id = ?
+        ORDER BY bucket
+    ''', (granularity, start, end, ALL_RESTAURANTS if restaurant_id is None else restaurant_id)).fetchall()
+
+def get_restaurant_sales(conn, granularity, from_date, to_date):
+    start, end = bucket_bounds(from_date, to_date)
+    return conn.execute('''
+        SELECT s.restaurant_id, r.name, SUM(s.orders) AS orders, SUM(s.items_sold) AS items_sold,
+               SUM(s.revenue) AS revenue
+        FROM restaurant_sales_rollup s
+        LEFT JOIN restaurants r ON r.restaurant_id = s.restaurant_id
+        WHERE s.granularity = ? AND s.bucket >= ? AND s.bucket < ? AND s.restaurant_id != ?
+        GROUP BY s.restaurant_id
+        ORDER BY revenue DESC
+    ''', (granularity, start, end, ALL_RESTAURANTS)).fetchall()
+
+def get_top_items(conn, granularity, from_date, to_date, limit=10):
+    start, end = bucket_bounds(from_date, to_date)
+    return conn.execute('''
+        SELECT t.item_id, m.name, t.quantity, t.revenue
+        FROM (
+            SELECT item_id, SUM(quantity) AS quantity, SUM(revenue) AS revenue
+            FROM item_sales_rollup
+            WHERE granularity = ? AND bucket >= ? AND bucket < ?
+            GROUP BY item_id
+            ORDER BY quantity DESC
+            LIMIT ?
+        ) t
+        LEFT JOIN menu_items m ON m.item_id = t.item_id
+        ORDER BY t.quantity DESC
+    ''', (granularity, start, end, limit)).fetchall()
+
+def analytics_range():
+    """Read granularity and an inclusive from/to date range from the query string.
+
+    Defaults to today for hourly buckets and the last 30 days for daily ones.
+    Returns (granularity, from_date, to_date) as 'YYYY-MM-DD' strings.
+    """
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ROLLUP_GRANULARITIES:
+        granularity = 'day'
+    today = datetime.now().date()
+    default_from = today if granularity == 'hour' else today - timedelta(days=30)
+
+    def parse(name, default):
+        try:
+            return datetime.strptime(request.args[name], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return default
+    return granularity, parse('from', default_from).isoformat(), parse('to', today).isoformat()
+
+def bucket_bounds(from_date, to_date):
+    # Half-open [from, day after to) so every hour bucket on the last day is included
+    end = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1)
+    return from_date, end.strftime('%Y-%m-%d')
 
 # -------------------- Basic Pages --------------------
 @app.route('/')
@@ -202,14 +924,13 @@ def register():
             flash('Email already registered.', 'danger')
             return render_template('register.html')
 
-        if any(check_password_hash(p[0], password) for p in cursor.execute("SELECT password FROM users").fetchall()):
+        if password_in_use(conn, password):
             flash('This password is already in use by another user.', 'danger')
             return render_template('register.html')
 
-        cursor.execute("INSERT INTO users (email, password, role) VALUES (?, ?, ?)",
-                       (email, generate_password_hash(password), 'customer'))
+        cursor.execute("INSERT INTO users (email, password, role, password_fingerprint) VALUES (?, ?, ?, ?)",
+                       (email, generate_password_hash(password), 'customer', password_fingerprint(password)))
         conn.commit()
-        conn.close()
         flash('Registration successful! Please log in.', 'success')
         return redirect(url_for('login'))
 
@@ -221,8 +942,8 @@ def login():
         email, password = request.form['email'], request.form['password']
         conn = get_db_connection()
         user = conn.execute("SELECT * FROM users WHERE email=? AND role='customer'", (email,)).fetchone()
-        conn.close()
         if user and check_password_hash(user['password'], password):
+            backfill_password_fingerprint(conn, user, password)
             session['user_id'] = user['user_id']
             session['name'] = user['name'] or "Customer"
             flash('Login successful!', 'success')
@@ -237,8 +958,8 @@ def admin_login():
         username, password = request.form['username'], request.form['password']
         conn = get_db_connection()
         admin = conn.execute("SELECT * FROM users WHERE email=? AND role='admin'", (username,)).fetchone()
-        conn.close()
         if admin and check_password_hash(admin['password'], password):
+            backfill_password_fingerprint(conn, admin, password)
             session['admin_id'] = admin['user_id']
             session['admin_name'] = admin['name']
             flash('Admin login successful.', 'success')
@@ -260,10 +981,9 @@ def admin_register():
             flash('Email already registered.', 'danger')
             return render_template('admin_register.html')
 
-        conn.execute("INSERT INTO users (email, password, role) VALUES (?, ?, ?)",
-                     (email, generate_password_hash(password), 'admin'))
+        conn.execute("INSERT INTO users (email, password, role, password_fingerprint) VALUES (?, ?, ?, ?)",
+                     (email, generate_password_hash(password), 'admin', password_fingerprint(password)))
         conn.commit()
-        conn.close()
         flash('Admin registered! You may now log in.', 'success')
         return redirect(url_for('admin_login'))
 
@@ -282,55 +1002,42 @@ def dashboard():
         flash('Please log in to access the dashboard.', 'warning')
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Get all products with category and restaurant names (your existing code)
-    cursor.execute('''
-        SELECT menu_items.*, categories.name AS category_name, restaurants.name AS restaurant_name
-        FROM menu_items
-        JOIN categories ON menu_items.category_id = categories.category_id
-        JOIN restaurants ON menu_items.restaurant_id = restaurants.restaurant_id
-    ''')
-    products = cursor.fetchall()
+    # Filters and cursor come from the query string so pages can be bookmarked
+    filters = {
+        'category_ids': sorted(set(request.args.getlist('category', type=int))),
+        'restaurant_ids': sorted(set(request.args.getlist('restaurant', type=int))),
+        'min_price': request.args.get('min_price', type=float),
+        'max_price': request.args.get('max_price', type=float),
+    }
+    cursor_id = request.args.get('cursor', 0, type=int)
+    products, next_cursor = get_product_page(**filters, after_id=cursor_id,
+                                             limit=app.config['DASHBOARD_PAGE_SIZE'])
+    next_url = None
+    if next_cursor:
+        args = request.args.to_dict(flat=False)
+        args.pop('format', None)
+        args['cursor'] = next_cursor
+        next_url = url_for('dashboard', **args)
+
+    ratings = get_rating_summaries(get_db_connection(), [p['item_id'] for p in products])
+
+    # Infinite scroll asks for just the next batch of cards
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'items': [dict(p) | {'rating': ratings.get(p['item_id'])} for p in products],
+            'html': render_template('product_cards.html', products=products, ratings=ratings),
+            'next_cursor': next_cursor,
+            'next_url': next_url,
+        })
 
     # Get all categories
-    cursor.execute('SELECT * FROM categories')
-    categories = cursor.fetchall()
+    categories = get_all_categories()
+    restaurants = get_all_restaurants()
 
-    # Get cart items for the logged-in user with product details
-    cursor.execute('''
-        SELECT c.cart_id, c.quantity, m.item_id, m.name, m.price, m.image
-        FROM cart c
-        JOIN menu_items m ON c.item_id = m.item_id
-        WHERE c.user_id = ?
-    ''', (session['user_id'],))
-    cart_items = cursor.fetchall()
-
-    # Calculate total price of the cart
-    total_price = sum(item['price'] * item['quantity'] for item in cart_items)
-
-    conn.close()
     return render_template('dashboard.html', name=session.get('name'), products=products, categories=categories,
-                           cart_items=cart_items, total_price=total_price)
-
-    # Get all products with category and restaurant names
-    cursor.execute('''
-        SELECT menu_items.*, categories.name AS category_name, restaurants.name AS restaurant_name
-        FROM menu_items
-        JOIN categories ON menu_items.category_id = categories.category_id
-        JOIN restaurants ON menu_items.restaurant_id = restaurants.restaurant_id
-    ''')
-    products = cursor.fetchall()
-
-    # Get all categories
-    cursor.execute('SELECT * FROM categories')
-    categories = cursor.fetchall()
-
-    conn.close()
-    return render_template('dashboard.html', name=session.get('name'), products=products, categories=categories)
-
-
+                           restaurants=restaurants, filters=filters, next_url=next_url, ratings=ratings,
+                           cart_summary=get_cart_summary(session['user_id']),
+                           unread_notifications=get_unread_count(session['user_id']))
 
 @app.route('/profile', methods=['GET', 'POST'])
 def profile():
@@ -353,16 +1060,14 @@ def profile():
         if 'profile_image' in request.files:
             image = request.files['profile_image']
             if image.filename:
-                filename = secure_filename(image.filename)
-                image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                profile_image = filename
+                profile_image = save_upload(image)
 
         fields = "name=?, email=?, contact=?, address=?"
         values = [name, email, contact, address]
 
         if password:
-            fields += ", password=?"
-            values.append(generate_password_hash(password))
+            fields += ", password=?, password_fingerprint=?"
+            values.extend([generate_password_hash(password), password_fingerprint(password)])
 
         if profile_image:
             fields += ", profile_image=?"
@@ -375,33 +1080,41 @@ def profile():
     # Get user info
     user = cursor.execute("SELECT * FROM users WHERE user_id=?", (user_id,)).fetchone()
 
-    # Get orders with item list
-    orders_raw = cursor.execute("""
-        SELECT o.order_id, o.order_date, o.order_status, o.total_amount
+    # Get one page of orders with their item list in a single query, newest first.
+    # The cursor is the (order_date, order_id) of the last order on the previous page.
+    page_size = app.config['ORDER_HISTORY_PAGE_SIZE']
+    before_date = request.args.get('before_date')
+    before_id = request.args.get('before_id', type=int)
+    after_cursor, params = '', [user_id]
+    if before_date is not None and before_id is not None:
+        after_cursor = 'AND (o.order_date, o.order_id) < (?, ?)'
+        params += [before_date, before_id]
+    orders_raw = cursor.execute(f"""
+        SELECT o.order_id, o.order_date, o.order_status, o.total_amount,
+               (SELECT GROUP_CONCAT(m.name, ', ')
+                FROM order_details od
+                JOIN menu_items m ON od.item_id = m.item_id
+                WHERE od.order_id = o.order_id) AS item_list
         FROM orders o
-        WHERE o.user_id = ?
-        ORDER BY o.order_date DESC
-    """, (user_id,)).fetchall()
-
-    orders = []
-    for o in orders_raw:
-        items = cursor.execute("""
-            SELECT m.name
-            FROM order_details od
-            JOIN menu_items m ON od.item_id = m.item_id
-            WHERE od.order_id = ?
-        """, (o['order_id'],)).fetchall()
-        item_list = ', '.join([item['name'] for item in items])
-        orders.append({
-    'id': o['order_id'],
-    'date': o['order_date'],  # use your actual column name here
-    'status': o['order_status'],
-    'total': o['total_amount'],
-    'item_list': item_list  # make sure you consistently use this key
-})
-
-    conn.close()
-    return render_template('profile.html', user=user, orders=orders)
+        WHERE o.user_id = ? {after_cursor}
+        ORDER BY o.order_date DESC, o.order_id DESC
+        LIMIT ?
+    """, params + [page_size + 1]).fetchall()
+
+    orders = [{
+        'id': o['order_id'],
+        'date': o['order_date'],
+        'status': o['order_status'],
+        'total': o['total_amount'],
+        'item_list': o['item_list'] or '',
+    } for o in orders_raw[:page_size]]
+
+    older_url = None
+    if len(orders_raw) > page_size:
+        last = orders_raw[page_size - 1]
+        older_url = url_for('profile', before_date=last['order_date'], before_id=last['order_id'])
+
+    return render_template('profile.html', user=user, orders=orders, older_url=older_url)
 
 
 # -------------------- Admin Panel --------------------
@@ -414,12 +1127,11 @@ def admin_dashboard():
 
 @app.route('/admin/overview')
 def admin_overview():
-    conn = get_db_connection()
-    total_orders = conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
-    total_products = conn.execute('SELECT COUNT(*) FROM menu_items').fetchone()[0]
-    total_sales = conn.execute('SELECT SUM(total_amount) FROM orders').fetchone()[0] or 0
-    total_customers = conn.execute('SELECT COUNT(*) FROM users WHERE role = "customer"').fetchone()[0]
-    conn.close()
+    stats = get_stats(get_db_connection())
+    total_orders = int(stats.get('total_orders', 0))
+    total_products = int(stats.get('total_products', 0))
+    total_sales = stats.get('total_sales', 0)
+    total_customers = int(stats.get('total_customers', 0))
 
     return render_template('admin_overview.html',
                            total_orders=total_orders,
@@ -427,12 +1139,52 @@ def admin_overview():
                            total_sales=total_sales,
                            total_customers=total_customers)
 
+@app.route('/admin/analytics')
+def admin_analytics():
+    if 'admin_id' not in session:
+        flash('Please log in as admin.', 'warning')
+        return redirect(url_for('admin_login'))
+
+    conn = get_db_connection()
+    granularity, from_date, to_date = analytics_range()
+    return render_template('admin_analytics.html',
+                           granularity=granularity, from_date=from_date, to_date=to_date,
+                           series=get_sales_series(conn, granularity, from_date, to_date),
+                           restaurants=get_restaurant_sales(conn, granularity, from_date, to_date),
+                           top_items=get_top_items(conn, granularity, from_date, to_date))
+
+@app.route('/admin/analytics/sales.json')
+def admin_sales_json():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'admin login required'}), 401
+
+    granularity, from_date, to_date = analytics_range()
+    restaurant_id = request.args.get('restaurant_id', type=int)
+    conn = get_db_connection()
+    return jsonify({
+        'granularity': granularity,
+        'from': from_date,
+        'to': to_date,
+        'series': [dict(row) for row in get_sales_series(conn, granularity, from_date, to_date, restaurant_id)],
+        'restaurants': [dict(row) for row in get_restaurant_sales(conn, granularity, from_date, to_date)],
+    })
+
+@app.route('/admin/analytics/top_items.json')
+def admin_top_items_json():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'admin login required'}), 401
+
+    granularity, from_date, to_date = analytics_range()
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    rows = get_top_items(get_db_connection(), granularity, from_date, to_date, limit)
+    return jsonify({'granularity': granularity, 'from': from_date, 'to': to_date,
+                    'items': [dict(row) for row in rows]})
+
 @app.route('/admin/manage')
 def admin_manage():
     conn = get_db_connection()
     products = conn.execute('SELECT * FROM menu_items').fetchall()
     orders = conn.execute('SELECT * FROM orders').fetchall()
-    conn.close()
     return render_template('admin_manage.html', products=products, orders=orders)
 
 @app.route('/admin/add_product', methods=['GET', 'POST'])
@@ -454,8 +1206,7 @@ def admin_add_product():
         image_filename = None
 
         if image and image.filename:
-            image_filename = secure_filename(image.filename)
-            image.save(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
+            image_filename = save_upload(image)
 
         cursor.execute('''
             INSERT INTO menu_items (name, description, price, category_id, restaurant_id, image)
@@ -463,15 +1214,97 @@ def admin_add_product():
         ''', (name, description, price, category_id, restaurant_id, image_filename))
 
         conn.commit()
-        conn.close()
+        invalidate_catalog()
         flash('Product added successfully!', 'success')
         return redirect(url_for('admin_manage'))
 
-    categories = cursor.execute("SELECT * FROM categories").fetchall()
-    restaurants = cursor.execute("SELECT * FROM restaurants").fetchall()
-    conn.close()
+    categories = get_all_categories()
+    restaurants = get_all_restaurants()
     return render_template('add_product.html', categories=categories, restaurants=restaurants)
 
+# -------------------- Bulk Import --------------------
+@app.cli.command('import-catalog')
+@click.argument('kind', type=click.Choice(list(importer.KINDS)))
+@click.argument('file', type=click.File('rb'))
+@click.option('--format', 'fmt', type=click.Choice(importer.FORMATS), help='Default: from the file extension.')
+@click.option('--batch-size', type=int, help='Rows per transaction (default IMPORT_BATCH_SIZE).')
+def import_catalog_command(kind, file, fmt, batch_size):
+    """Stream categories, restaurants or menu items from a CSV/JSONL file."""
+    fmt = fmt or importer.detect_format(file.name)
+    if fmt is None:
+        raise click.UsageError('Cannot tell the format from the file name; pass --format.')
+    result = importer.import_rows(get_db_connection(), kind, importer.read_rows(file, fmt),
+                                  batch_size or app.config['IMPORT_BATCH_SIZE'])
+    invalidate_catalog()
+    for line_num, message in result.errors:
+        click.echo(f'line {line_num}: {message}', err=True)
+    if result.failed > len(result.errors):
+        click.echo(f'... and {result.failed - len(result.errors)} more errors', err=True)
+    click.echo(f'Inserted {result.inserted}, skipped {result.skipped} existing, {result.failed} failed.')
+
+@app.route('/admin/import', methods=['GET', 'POST'])
+def admin_import():
+    if 'admin_id' not in session:
+        flash('Please log in as admin.', 'warning')
+        return redirect(url_for('admin_login'))
+
+    result = None
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        fmt = request.form.get('format') or importer.detect_format(upload.filename if upload else '')
+        if kind not in importer.KINDS or not upload or not upload.filename or fmt not in importer.FORMATS:
+            flash('Choose what to import and a .csv or .jsonl file.', 'danger')
+            return redirect(url_for('admin_import'))
+        batch_size = request.form.get('batch_size', app.config['IMPORT_BATCH_SIZE'], type=int)
+        # The upload is spooled to disk by Werkzeug and read back row by row
+        result = importer.import_rows(get_db_connection(), kind, importer.read_rows(upload.stream, fmt),
+                                      max(1, batch_size)).as_dict()
+        invalidate_catalog()
+        if request.args.get('format') == 'json':
+            return jsonify(result)
+
+    return render_template('admin_import.html', kinds=list(importer.KINDS), result=result,
+                           batch_size=app.config['IMPORT_BATCH_SIZE'])
+
+# -------------------- Order Export --------------------
+@app.cli.command('export-orders')
+@click.option('--format', 'fmt', type=click.Choice(list(exporter.FORMATS)), default='csv', show_default=True)
+@click.option('--from', 'from_date', help='First order date, YYYY-MM-DD.')
+@click.option('--to', 'to_date', help='Last order date (inclusive), YYYY-MM-DD.')
+@click.option('--status', help='Only orders with this status.')
+@click.option('--output', type=click.File('w'), default='-', help='Default: stdout.')
+def export_orders_command(fmt, from_date, to_date, status, output):
+    """Stream orders with their lines, payment and delivery as CSV or JSONL."""
+    try:
+        filters = exporter.parse_filters(from_date, to_date, status)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc))
+    orders = exporter.iter_orders(get_db_connection(), filters, app.config['EXPORT_CHUNK_SIZE'])
+    for chunk in exporter.RENDERERS[fmt](orders):
+        output.write(chunk)
+
+@app.route('/admin/export/orders')
+def admin_export_orders():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    fmt = request.args.get('format', 'csv')
+    if fmt not in exporter.FORMATS:
+        return jsonify({'error': f'format must be one of {", ".join(exporter.FORMATS)}'}), 400
+    try:
+        filters = exporter.parse_filters(request.args.get('from'), request.args.get('to'), request.args.get('status'))
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    # stream_with_context keeps g (and its pooled connection) alive while the body is generated
+    def generate():
+        orders = exporter.iter_orders(get_db_connection(), filters, app.config['EXPORT_CHUNK_SIZE'])
+        yield from exporter.RENDERERS[fmt](orders)
+
+    filename = f"orders-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return Response(stream_with_context(generate()), mimetype=exporter.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.route('/admin/add_category', methods=['GET', 'POST'])
 def admin_add_category():
     if 'admin_id' not in session:
@@ -487,12 +1320,11 @@ def admin_add_category():
         conn = get_db_connection()
         if conn.execute("SELECT * FROM categories WHERE name = ?", (category_name,)).fetchone():
             flash('Category already exists.', 'danger')
-            conn.close()
             return render_template('add_category.html')
 
         conn.execute("INSERT INTO categories (name) VALUES (?)", (category_name,))
         conn.commit()
-        conn.close()
+        invalidate_catalog()
         flash('Category added successfully!', 'success')
         return redirect(url_for('admin_manage'))
 
@@ -509,7 +1341,7 @@ def admin_add_restaurant():
         conn = get_db_connection()
         conn.execute("INSERT INTO restaurants (name, location, contact) VALUES (?, ?, ?)", (name, location, contact))
         conn.commit()
-        conn.close()
+        invalidate_catalog()
         flash('Restaurant added successfully!', 'success')
         return redirect(url_for('admin_manage'))
 
@@ -526,31 +1358,65 @@ def edit_product(product_id):
         price = request.form['price']
         category_id = request.form['category_id']
         restaurant_id = request.form['restaurant_id']
-
-        cursor.execute('''
-            UPDATE menu_items
-            SET name = ?, description = ?, price = ?, category_id = ?, restaurant_id = ?
-            WHERE item_id = ?
-        ''', (name, description, price, category_id, restaurant_id, product_id))
-        conn.commit()
-        conn.close()
+        stock = request.form.get('stock', type=int)  # blank: unlimited
+        daily_limit = request.form.get('daily_limit', type=int)
+        original_stock = request.form.get('original_stock', type=int)  # as shown when the form was opened
+
+        with transaction(conn):
+            conn.execute('''
+                UPDATE menu_items
+                SET name = ?, description = ?, price = ?, category_id = ?, restaurant_id = ?
+                WHERE item_id = ?
+            ''', (name, description, price, category_id, restaurant_id, product_id))
+            stock_saved = inventory.edit_stock(conn, product_id, stock, daily_limit, original_stock)
+        invalidate_catalog()
+        if not stock_saved:
+            flash('Stock changed while you were editing, so it was not updated. Check the new count and try again.',
+                  'warning')
+            return redirect(url_for('edit_product', product_id=product_id))
         return redirect(url_for('admin_manage'))
 
     product = cursor.execute('SELECT * FROM menu_items WHERE item_id = ?', (product_id,)).fetchone()
-    categories = cursor.execute('SELECT * FROM categories').fetchall()
-    restaurants = cursor.execute('SELECT * FROM restaurants').fetchall()
-    conn.close()
-    return render_template('edit_product.html', product=product, categories=categories, restaurants=restaurants)
+    stock = cursor.execute('SELECT stock, daily_limit FROM inventory WHERE item_id = ?', (product_id,)).fetchone()
+    categories = get_all_categories()
+    restaurants = get_all_restaurants()
+    return render_template('edit_product.html', product=product, stock=stock, categories=categories,
+                           restaurants=restaurants)
 
 @app.route('/admin/delete_product/<int:product_id>')
 def delete_product(product_id):
     conn = get_db_connection()
     conn.execute('DELETE FROM menu_items WHERE item_id = ?', (product_id,))
     conn.commit()
-    conn.close()
+    invalidate_catalog()
     flash('Product deleted successfully.', 'success')
     return redirect(url_for('admin_manage'))
 
+@app.cli.command('set-stock')
+@click.argument('item_id', type=int)
+@click.option('--stock', type=int, help='Units left to sell; omit for unlimited.')
+@click.option('--daily-limit', type=int, help='Units that may be sold per day; omit for no cap.')
+def set_stock_command(item_id, stock, daily_limit):
+    """Set (or with no options, stop tracking) an item's stock."""
+    conn = get_db_connection()
+    with transaction(conn):
+        inventory.set_stock(conn, item_id, stock, daily_limit)
+    click.echo(f'Item #{item_id}: stock {stock if stock is not None else "unlimited"}, '
+               f'daily limit {daily_limit if daily_limit is not None else "none"}.')
+
+@app.cli.command('bench-stock')
+@click.option('--item', 'item_id', type=int, help='Hot item (default: the lowest item id).')
+@click.option('--stock', default=100, show_default=True, help='Units on hand when the run starts.')
+@click.option('--checkouts', default=500, show_default=True, help='Checkouts attempted, one unit each.')
+@click.option('--concurrency', default=16, show_default=True, help='Concurrent customers.')
+def bench_stock_command(item_id, stock, checkouts, concurrency):
+    """Race many checkouts for one item and check nothing is oversold. Writes orders; use a copy."""
+    conn = get_db_connection()
+    result = bench.run_stock_contention(app, conn, item_id, stock, checkouts, concurrency)
+    click.echo(json.dumps(result, indent=2))
+    if result['oversold']:
+        raise click.ClickException(f'Oversold by {result["oversold"]} units.')
+
 # -------------------- Public Product View --------------------
 @app.route('/product/<int:product_id>', methods=['GET', 'POST'])
 def view_product(product_id):
@@ -558,25 +1424,65 @@ def view_product(product_id):
     cursor = conn.cursor()
 
     # Get product info
-    cursor.execute('''
-        SELECT menu_items.*, categories.name AS category_name, restaurants.name AS restaurant_name
-        FROM menu_items
-        JOIN categories ON menu_items.category_id = categories.category_id
-        JOIN restaurants ON menu_items.restaurant_id = restaurants.restaurant_id
-        WHERE item_id = ?
-    ''', (product_id,))
-    product = cursor.fetchone()
+    product = get_product(product_id)
 
     if not product:
         flash("Product not found.", "danger")
         return redirect(url_for('dashboard'))
 
-    # Get product reviews
-    cursor.execute('SELECT * FROM reviews WHERE item_id = ?', (product_id,))
-    reviews = cursor.fetchall()
+    # Get one page of reviews, newest first; the cursor is the (date, review_id) of the last one shown
+    page_size = app.config['REVIEWS_PAGE_SIZE']
+    before_date = request.args.get('before_date')
+    before_id = request.args.get('before_id', type=int)
+    after_cursor, params = '', [product_id]
+    if before_date is not None and before_id is not None:
+        after_cursor = 'AND (r.date, r.review_id) < (?, ?)'
+        params += [before_date, before_id]
+    reviews = cursor.execute(f'''
+        SELECT r.*, COALESCE(u.name, u.email) AS username, u.profile_image
+        FROM reviews r
+        LEFT JOIN users u ON u.user_id = r.user_id
+        WHERE r.item_id = ? {after_cursor}
+        ORDER BY r.date DESC, r.review_id DESC
+        LIMIT ?
+    ''', params + [page_size + 1]).fetchall()
+
+    older_url = None
+    if len(reviews) > page_size:
+        reviews = reviews[:page_size]
+        older_url = url_for('view_product', product_id=product_id,
+                            before_date=reviews[-1]['date'], before_id=reviews[-1]['review_id'])
+
+    user_review = None
+    if 'user_id' in session:
+        user_review = cursor.execute('SELECT rating, comment FROM reviews WHERE user_id = ? AND item_id = ?',
+                                     (session['user_id'], product_id)).fetchone()
+
+    # Stock moves with every order, so it is read fresh rather than cached with the product
+    stock_left = inventory.levels(conn, [product_id], datetime.now().strftime('%Y-%m-%d')).get(product_id)
+
+    return render_template('product_detail.html', product=product, reviews=reviews, older_url=older_url,
+                           rating=get_review_stats(conn, product_id), user_review=user_review, stock_left=stock_left)
+
+@app.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    page = min(max(request.args.get('page', 1, type=int), 1), app.config['SEARCH_MAX_PAGES'])
+    conn = get_db_connection()
+    products, has_more = search_menu(conn, query, page, app.config['SEARCH_PAGE_SIZE'])
+    has_more = has_more and page < app.config['SEARCH_MAX_PAGES']
+    ratings = get_rating_summaries(conn, [p['item_id'] for p in products])
+
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'query': query,
+            'page': page,
+            'items': [dict(p) | {'rating': ratings.get(p['item_id'])} for p in products],
+            'next_page': page + 1 if has_more else None,
+        })
 
-    conn.close()
-    return render_template('product_detail.html', product=product, reviews=reviews)
+    return render_template('search.html', query=query, products=products, ratings=ratings,
+                           page=page, has_more=has_more)
 
 @app.route('/add_to_cart', methods=['POST'])
 def add_to_cart():
@@ -592,28 +1498,15 @@ def add_to_cart():
         return redirect(request.referrer or url_for('dashboard'))
 
     conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Check if item already in cart
-    cursor.execute('''
-        SELECT * FROM cart
-        WHERE user_id = ? AND item_id = ?
-    ''', (session['user_id'], item_id))
-    item = cursor.fetchone()
-
-    if item:
-        cursor.execute('''
-            UPDATE cart SET quantity = quantity + ?
-            WHERE user_id = ? AND item_id = ?
-        ''', (quantity, session['user_id'], item_id))
-    else:
-        cursor.execute('''
-            INSERT INTO cart (user_id, item_id, quantity)
-            VALUES (?, ?, ?)
-        ''', (session['user_id'], item_id, quantity))
 
+    # Add the line or bump its quantity in one statement (unique on user_id, item_id)
+    conn.execute('''
+        INSERT INTO cart (user_id, item_id, quantity)
+        VALUES (?, ?, ?)
+        ON CONFLICT (user_id, item_id) DO UPDATE SET quantity = quantity + excluded.quantity
+    ''', (session['user_id'], item_id, quantity))
     conn.commit()
-    conn.close()
+    invalidate_cart_summary(session['user_id'])
 
     flash("Item added to cart!", "success")
     return redirect(request.referrer or url_for('dashboard'))
@@ -631,28 +1524,35 @@ def leave_review():
     comment = request.form['comment']
     date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
+    if rating not in range(1, 6):
+        flash('Rating must be between 1 and 5.', 'danger')
+        return redirect(url_for('view_product', product_id=item_id))
+
     conn = get_db_connection()
-    cursor = conn.cursor()
 
-    existing = cursor.execute('SELECT * FROM reviews WHERE user_id = ? AND item_id = ?', (user_id, item_id)).fetchone()
+    # Review and aggregate change together, under the write lock
+    with transaction(conn):
+        existing = conn.execute('SELECT rating FROM reviews WHERE user_id = ? AND item_id = ?', (user_id, item_id)).fetchone()
+
+        if existing:
+            # Update existing review
+            conn.execute('''
+                UPDATE reviews SET rating = ?, comment = ?, date = ?
+                WHERE user_id = ? AND item_id = ?
+            ''', (rating, comment, date, user_id, item_id))
+            record_review_rating(conn, item_id, rating, old_rating=existing['rating'])
+        else:
+            # Insert new review
+            conn.execute('''
+                INSERT INTO reviews (user_id, item_id, rating, comment, date)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, item_id, rating, comment, date))
+            record_review_rating(conn, item_id, rating)
 
     if existing:
-        # Update existing review
-        cursor.execute('''
-            UPDATE reviews SET rating = ?, comment = ?, date = ?
-            WHERE user_id = ? AND item_id = ?
-        ''', (rating, comment, date, user_id, item_id))
         flash('Your review has been updated.', 'info')
     else:
-        # Insert new review
-        cursor.execute('''
-            INSERT INTO reviews (user_id, item_id, rating, comment, date)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, item_id, rating, comment, date))
         flash('Your review has been submitted.', 'success')
-
-    conn.commit()
-    conn.close()
     return redirect(url_for('view_product', product_id=item_id))
 
 @app.route('/cart/update_quantity/<int:cart_id>/<action>')
@@ -662,24 +1562,16 @@ def update_cart_quantity(cart_id, action):
         return redirect(url_for('login'))
 
     conn = get_db_connection()
-    cursor = conn.cursor()
 
-    # Get current quantity
-    cart_item = cursor.execute('SELECT quantity FROM cart WHERE cart_id = ? AND user_id = ?', (cart_id, session['user_id'])).fetchone()
-    if not cart_item:
+    # Adjust in place; quantity never drops below 1 (use remove for that)
+    delta = {'add': 1, 'reduce': -1}.get(action, 0)
+    updated = conn.execute('UPDATE cart SET quantity = MAX(quantity + ?, 1) WHERE cart_id = ? AND user_id = ?',
+                           (delta, cart_id, session['user_id'])).rowcount
+    conn.commit()
+    if not updated:
         flash("Cart item not found.", "danger")
-        conn.close()
         return redirect(url_for('dashboard'))
-
-    quantity = cart_item['quantity']
-    if action == 'add':
-        quantity += 1
-    elif action == 'reduce' and quantity > 1:
-        quantity -= 1
-
-    cursor.execute('UPDATE cart SET quantity = ? WHERE cart_id = ?', (quantity, cart_id))
-    conn.commit()
-    conn.close()
+    invalidate_cart_summary(session['user_id'])
 
     return redirect(url_for('orders')) 
 
@@ -693,7 +1585,7 @@ def remove_cart_item(cart_id):
     cursor = conn.cursor()
     cursor.execute('DELETE FROM cart WHERE cart_id = ? AND user_id = ?', (cart_id, session['user_id']))
     conn.commit()
-    conn.close()
+    invalidate_cart_summary(session['user_id'])
 
     flash("Item removed from cart.", "success")
     return redirect(url_for('orders'))
@@ -708,13 +1600,17 @@ def checkout():
     conn = get_db_connection()
     conn.execute('DELETE FROM cart WHERE user_id = ?', (session['user_id'],))
     conn.commit()
-    conn.close()
+    invalidate_cart_summary(session['user_id'])
 
     flash("Checkout successful! Thank you for your order.", "success")
     return redirect(url_for('dashboard'))
 
 @app.route("/cart")
 def cart():
+    if 'user_id' not in session:
+        flash("Please log in.", "warning")
+        return redirect(url_for('login'))
+
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('''
@@ -724,7 +1620,6 @@ def cart():
         WHERE cart.user_id = ?
     ''', (session["user_id"],))
     cart_items = cursor.fetchall()
-    conn.close()
 
     total_price = sum(item["price"] * item["quantity"] for item in cart_items)
 
@@ -744,22 +1639,20 @@ def process_checkout():
     # Get user info
     user = conn.execute("SELECT * FROM users WHERE user_id = ?", (session['user_id'],)).fetchone()
 
-    # Get cart items
-    cart_items = conn.execute('''
-        SELECT c.quantity, m.price
+    # Current prices, as create_order will charge them
+    product_total = conn.execute('''
+        SELECT COALESCE(SUM(c.quantity * m.price), 0)
         FROM cart c JOIN menu_items m ON c.item_id = m.item_id
         WHERE c.user_id = ?
-    ''', (session['user_id'],)).fetchall()
-
-    product_total = sum(item['quantity'] * item['price'] for item in cart_items)
+    ''', (session['user_id'],)).fetchone()[0]
     shipping_cost = 50  # Fixed shipping for now
-
-    conn.close()
+    available_drivers = conn.execute("SELECT COUNT(*) FROM drivers WHERE status = 'available'").fetchone()[0]
 
     return render_template('process_checkout.html', user=user,
-                           driver_name="Juan Dela Cruz",
+                           available_drivers=available_drivers,
                            product_total=product_total,
-                           shipping_cost=shipping_cost)
+                           shipping_cost=shipping_cost,
+                           idempotency_key=uuid.uuid4().hex)
 
 @app.route('/place_order', methods=['POST'])
 def place_order():
@@ -767,62 +1660,149 @@ def place_order():
         return redirect(url_for('login'))
 
     conn = get_db_connection()
+    user_id = session['user_id']
+    # The checkout form carries a one-time key so a double submit or retry maps to the same order
+    idempotency_key = request.form.get('idempotency_key') or request.headers.get('Idempotency-Key')
+
+    shortage = inventory.check_cart(conn, user_id, datetime.now().strftime('%Y-%m-%d'))
+    if shortage is not None:
+        flash(str(shortage), 'warning')
+        return redirect(url_for('cart'))
+    try:
+        with transaction(conn):
+            order_id, created = create_order(conn, user_id, idempotency_key)
+    except sqlite3.IntegrityError:
+        # Lost a race on the idempotency key; the winner's order is the answer.
+        # Any other constraint failure is a real error, not an empty cart.
+        order_id, created = find_order_by_key(conn, user_id, idempotency_key), False
+        if order_id is None:
+            raise
+    except inventory.OutOfStock as exc:
+        # Sold out between the check above and taking the write lock
+        flash(str(exc), 'warning')
+        return redirect(url_for('cart'))
+    invalidate_cart_summary(user_id)
+    if created:
+        job_worker.wake()
+
+    if order_id is None:
+        flash('Your cart is empty.', 'warning')
+        return redirect(url_for('cart'))
+    if not created:
+        flash(f'Order #{order_id} was already placed.', 'info')
+        return redirect(url_for('dashboard'))
+
+    flash('Order complete!')
+    return redirect(url_for('dashboard'))
+
+def find_order_by_key(conn, user_id, idempotency_key):
+    if not idempotency_key:
+        return None
+    row = conn.execute('SELECT order_id FROM orders WHERE user_id = ? AND idempotency_key = ?',
+                       (user_id, idempotency_key)).fetchone()
+    return row['order_id'] if row else None
+
+def create_order(conn, user_id, idempotency_key=None):
+    """Turn the user's cart into an order. Must run inside a write transaction.
+
+    Returns (order_id, created); order_id is None when the cart is empty.
+    """
+    existing = find_order_by_key(conn, user_id, idempotency_key)
+    if existing is not None:
+        return existing, False
+
     cursor = conn.cursor()
 
-    # Get cart and user info
-    user_id = session['user_id']
+    # Get cart with current prices; they are snapshotted into order_details below
     cart_items = conn.execute('''
-        SELECT c.item_id, c.quantity, m.price
+        SELECT c.item_id, c.quantity, m.price, m.restaurant_id
         FROM cart c JOIN menu_items m ON c.item_id = m.item_id
         WHERE c.user_id = ?
     ''', (user_id,)).fetchall()
+    if not cart_items:
+        return None, False
 
     product_total = sum(item['quantity'] * item['price'] for item in cart_items)
     shipping_cost = 50
     total = product_total + shipping_cost
     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
+    # Reserve stock before writing anything; raises OutOfStock and the caller rolls back
+    reserved = inventory.reserve(conn, [(item['item_id'], item['quantity']) for item in cart_items], now[:10])
+
     # 1. Create order
     cursor.execute('''
-        INSERT INTO orders (user_id, total_amount, order_status, order_date)
-        VALUES (?, ?, ?, ?)
-    ''', (user_id, total, 'Pending', now))
+        INSERT INTO orders (user_id, total_amount, order_status, order_date, idempotency_key)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (user_id, total, 'Pending', now, idempotency_key))
     order_id = cursor.lastrowid
+    inventory.record_reservation(conn, order_id, reserved)
 
     # 2. Insert order details
-    for item in cart_items:
-        subtotal = item['quantity'] * item['price']
-        cursor.execute('''
-            INSERT INTO order_details (order_id, item_id, quantity, subtotal)
-            VALUES (?, ?, ?, ?)
-        ''', (order_id, item['item_id'], item['quantity'], subtotal))
-
-    # 3. Insert delivery
-    cursor.execute('''
-        INSERT INTO delivery (order_id, driver_name, delivery_status, estimated_time)
-        VALUES (?, ?, ?, ?)
-    ''', (order_id, 'Juan Dela Cruz', 'Pending', '2025-05-21 18:00'))
-    delivery_id = cursor.lastrowid
-
-    # 4. Insert payment
-    cursor.execute('''
-        INSERT INTO payments (order_id, amount, payment_method, payment_status, date)
+    cursor.executemany('''
+        INSERT INTO order_details (order_id, item_id, quantity, unit_price, subtotal)
         VALUES (?, ?, ?, ?, ?)
-    ''', (order_id, total, 'COD', 'Pending', now))
-    payment_id = cursor.lastrowid
+    ''', [(order_id, item['item_id'], item['quantity'], item['price'], item['quantity'] * item['price'])
+          for item in cart_items])
 
-    # 5. Update order with delivery and payment ID
-    cursor.execute('''
-        UPDATE orders SET payment_id = ?, delivery_id = ? WHERE order_id = ?
-    ''', (payment_id, delivery_id, order_id))
+    # 3. Delivery, payment and the confirmation are queued; they commit with the order
+    for job in ORDER_FOLLOW_UP_JOBS:
+        jobs.enqueue(conn, job, {'order_id': order_id}, max_attempts=app.config['JOB_MAX_ATTEMPTS'])
 
-    # 6. Clear cart
+    # 4. Clear cart
     cursor.execute('DELETE FROM cart WHERE user_id = ?', (user_id,))
-    conn.commit()
-    conn.close()
 
-    flash('Order complete!')
-    return redirect(url_for('dashboard'))
+    # 5. Fold into the analytics buckets
+    fold_order_into_rollups(conn, now, [(item['item_id'], item['restaurant_id'], item['quantity'],
+                                         item['quantity'] * item['price']) for item in cart_items])
+    return order_id, True
+
+# -------------------- Order Follow-up Jobs --------------------
+# Run by job_worker after place_order commits. Each may run more than once
+# (retries, visibility timeouts), so each checks whether its work is done.
+ORDER_FOLLOW_UP_JOBS = ('assign_delivery', 'settle_payment', 'notify_order_placed')
+FINAL_ORDER_STATUSES = ('Delivered', 'Cancelled')  # no driver is needed any more
+
+@job_worker.handler('assign_delivery')
+def assign_delivery_job(conn, payload):
+    order_id = payload['order_id']
+    with transaction(conn):
+        order = conn.execute('SELECT delivery_id, order_status FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+        if order is None or order['delivery_id'] is not None or order['order_status'] in FINAL_ORDER_STATUSES:
+            return
+        # The dispatcher picks a driver and sets the ETA in its next batch
+        delivery_id = conn.execute('INSERT INTO delivery (order_id, delivery_status) VALUES (?, ?)',
+                                   (order_id, dispatch.AWAITING)).lastrowid
+        conn.execute('UPDATE orders SET delivery_id = ? WHERE order_id = ?', (delivery_id, order_id))
+    dispatcher.wake()
+    publish_order_update(conn, order_id)
+
+@job_worker.handler('settle_payment')
+def settle_payment_job(conn, payload):
+    order_id = payload['order_id']
+    with transaction(conn):
+        order = conn.execute('SELECT payment_id, total_amount FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+        if order is None or order['payment_id'] is not None:
+            return
+        # Cash on delivery is the only method; it is settled when the rider collects
+        payment_id = conn.execute('''
+            INSERT INTO payments (order_id, amount, payment_method, payment_status, date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (order_id, order['total_amount'], 'COD', 'Pending', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))).lastrowid
+        conn.execute('UPDATE orders SET payment_id = ? WHERE order_id = ?', (payment_id, order_id))
+
+@job_worker.handler('notify_order_placed')
+def notify_order_placed_job(conn, payload):
+    order_id = payload['order_id']
+    message = f'Your order #{order_id} has been placed.'
+    with transaction(conn):
+        conn.execute('''
+            INSERT INTO notifications (user_id, message, timestamp)
+            SELECT o.user_id, ?, ? FROM orders o
+            WHERE o.order_id = ? AND NOT EXISTS (
+                SELECT 1 FROM notifications n WHERE n.user_id = o.user_id AND n.message = ?
+            )
+        ''', (message, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), order_id, message))
 
 @app.route('/admin/update_order_status/<int:order_id>', methods=['POST'])
 def update_order_status(order_id):
@@ -836,9 +1816,30 @@ def update_order_status(order_id):
         return redirect(url_for('admin_manage'))
 
     conn = get_db_connection()
-    conn.execute('UPDATE orders SET order_status = ? WHERE order_id = ?', (new_status, order_id))
-    conn.commit()
-    conn.close()
+    with transaction(conn):
+        # Cancelling is final, so stock is only ever given back once
+        order = conn.execute('''
+            UPDATE orders SET order_status = ? WHERE order_id = ? AND order_status != 'Cancelled'
+            RETURNING user_id
+        ''', (new_status, order_id)).fetchone()
+        released = None
+        if order is not None and new_status == 'Delivered':
+            # The driver is free again, wherever they dropped the order off
+            address = conn.execute('SELECT address FROM users WHERE user_id = ?', (order['user_id'],)).fetchone()
+            released = dispatch.release_driver(conn, order_id, 'Delivered',
+                                               dispatch.locate(address['address']) if address else None)
+            inventory.consume(conn, order_id)
+        elif order is not None and new_status == 'Cancelled':
+            inventory.release(conn, order_id)
+            released = dispatch.release_driver(conn, order_id, 'Cancelled')
+    if order is None:
+        flash('Order not found, or already cancelled.', 'warning')
+        return redirect(url_for('admin_manage'))
+    if released is not None:
+        dispatcher.wake()
+    publish_order_update(conn, order_id)
+    if order is not None and order['user_id'] is not None:
+        notifier.add(order['user_id'], f'Your order #{order_id} is now {new_status}.')
     flash('Order status updated successfully.', 'success')
     return redirect(url_for('admin_manage'))
 
@@ -847,16 +1848,322 @@ def admin_products():
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
 
+    return render_template('admin_products.html', products=get_all_products())
+
+@app.route('/admin/cache_stats')
+def admin_cache_stats():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    return jsonify({'catalog': catalog_cache.stats(), 'cart_summary': cart_summary_cache.stats(),
+                    'order_events': order_events.stats(), 'notifications': notifier.stats()})
+
+@app.route('/admin/jobs')
+def admin_jobs():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
     conn = get_db_connection()
-    products = conn.execute('''
-        SELECT m.*, c.name AS category_name, r.name AS restaurant_name
-        FROM menu_items m
-        JOIN categories c ON m.category_id = c.category_id
-        JOIN restaurants r ON m.restaurant_id = r.restaurant_id
-    ''').fetchall()
-    conn.close()
+    return jsonify({'queue': jobs.queue_stats(conn), 'dead': [dict(row) for row in get_dead_jobs(conn)]})
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
-    return render_template('admin_products.html', products=products)
+@app.route('/admin/slow_requests')
+def admin_slow_requests():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    return jsonify({'threshold_seconds': app.config['SLOW_REQUEST_SECONDS'], 'requests': list(reversed(slow_requests))})
+
+# -------------------- Order Events --------------------
+# Live order/delivery status over server-sent events. Writers publish to the
+# in-process hub after committing; each stream also re-reads the order on its
+# heartbeat, which picks up changes committed by other worker processes.
+order_events = EventHub(max_subscribers=app.config['SSE_MAX_SUBSCRIBERS'])
+
+def get_order_state(conn, order_id):
+    row = conn.execute('''
+        SELECT o.order_id, o.user_id, o.order_status, d.delivery_status, d.driver_name, d.estimated_time
+        FROM orders o LEFT JOIN delivery d ON d.delivery_id = o.delivery_id
+        WHERE o.order_id = ?
+    ''', (order_id,)).fetchone()
+    return dict(row) if row else None
+
+def publish_order_update(conn, order_id):
+    """Push the order's current status to live subscribers; call after committing."""
+    state = get_order_state(conn, order_id)
+    if state is not None:
+        order_events.publish(f'order:{order_id}', 'status', state)
+
+def read_order_state(order_id):
+    # Streams outlive the request's app context, so borrow a pooled connection briefly
+    pool = get_db_pool()
+    conn = pool.acquire()
+    try:
+        return get_order_state(conn, order_id)
+    finally:
+        pool.release(conn)
+
+@app.route('/orders/<int:order_id>/events')
+def order_event_stream(order_id):
+    if 'user_id' not in session and 'admin_id' not in session:
+        return jsonify({'error': 'login required'}), 401
+    state = get_order_state(get_db_connection(), order_id)
+    if state is None or ('admin_id' not in session and state['user_id'] != session['user_id']):
+        return jsonify({'error': 'order not found'}), 404
+
+    topic = f'order:{order_id}'
+    try:
+        # Subscribe before deciding what to replay so nothing published in between is lost
+        subscription = order_events.subscribe(topic)
+    except TooManySubscribers:
+        return jsonify({'error': 'too many live connections, retry later'}), 503, {'Retry-After': '30'}
+
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    missed = order_events.since(topic, last_event_id) if last_event_id is not None else None
+    heartbeat = app.config['SSE_HEARTBEAT_SECONDS']
+    retry = app.config['SSE_RETRY_MS']
+
+    def stream():
+        last_sent = state
+        try:
+            if missed is None:
+                yield format_event(None, 'status', state, retry=retry)
+            else:
+                yield f'retry: {retry}\n\n'
+                for event_id, name, data in missed:
+                    last_sent = data
+                    yield format_event(event_id, name, data)
+            while True:
+                event = subscription.get(heartbeat)
+                if event is not None:
+                    last_sent = event[2]
+                    yield format_event(*event)
+                    continue
+                current = read_order_state(order_id)
+                if current is not None and current != last_sent:
+                    last_sent = current
+                    yield format_event(None, 'status', current)
+                else:
+                    yield ': heartbeat\n\n'
+        finally:
+            subscription.close()
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# -------------------- Driver Dispatch --------------------
+# Deliveries start out 'Awaiting driver'; the dispatcher assigns the nearest
+# free driver to each in periodic batches and publishes the new ETA.
+def publish_assignments(conn, order_ids):
+    for order_id in order_ids:
+        publish_order_update(conn, order_id)
+
+dispatcher = dispatch.Dispatcher(get_db_pool, interval=app.config['DISPATCH_INTERVAL_SECONDS'],
+                                 batch_size=app.config['DISPATCH_BATCH_SIZE'], cell_km=app.config['DISPATCH_CELL_KM'],
+                                 max_km=app.config['DISPATCH_MAX_KM'], speed_kmh=app.config['DRIVER_SPEED_KMH'],
+                                 prep_minutes=app.config['PREP_MINUTES'], on_assigned=publish_assignments)
+
+@app.before_request
+def start_dispatcher():
+    dispatcher.ensure_started()
+
+@app.route('/admin/dispatch')
+def admin_dispatch():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    return jsonify({'drivers': dispatch.driver_stats(get_db_connection()), 'last_batch': dispatcher.last_batch})
+
+@app.cli.command('dispatch')
+def dispatch_command():
+    """Assign waiting deliveries to drivers once."""
+    click.echo(json.dumps(dispatcher.run_batch(get_db_connection())))
+
+@app.cli.command('add-driver')
+@click.argument('name')
+@click.option('--at', 'location', help='"lat, lng" or a known place name.')
+def add_driver_command(name, location):
+    """Register a driver, available straight away."""
+    point = dispatch.locate(location) if location else None
+    if location and point is None:
+        raise click.BadParameter(f'cannot place {location!r}', param_hint='--at')
+    conn = get_db_connection()
+    with transaction(conn):
+        driver_id = conn.execute('''
+            INSERT INTO drivers (name, latitude, longitude, status, updated_at) VALUES (?, ?, ?, 'available', ?)
+        ''', (name, *(point or (None, None)), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))).lastrowid
+    click.echo(f'Added driver #{driver_id}.')
+
+@app.cli.command('bench-dispatch')
+@click.option('--orders', default=10000, show_default=True, help='Pending orders in the batch.')
+@click.option('--drivers', default=2000, show_default=True, help='Available drivers.')
+@click.option('--seed', 'rng_seed', default=42, show_default=True)
+@click.option('--brute-force', is_flag=True, help='Also time the scan-every-driver baseline.')
+def bench_dispatch_command(orders, drivers, rng_seed, brute_force):
+    """Time matching one dispatch batch of synthetic orders and drivers."""
+    result = bench.run_dispatch(orders, drivers, rng_seed, app.config['DISPATCH_CELL_KM'], app.config['DISPATCH_MAX_KM'],
+                                brute_force)
+    click.echo(json.dumps(result, indent=2))
+
+# -------------------- Notifications --------------------
+# Per-message notifications (order status changes) go through the buffer and
+# are written in batches; broadcasts run as a job that walks users in chunks.
+notifier = notifications.NotificationBuffer(get_db_pool, batch_size=app.config['NOTIFY_BATCH_SIZE'],
+                                            flush_interval=app.config['NOTIFY_FLUSH_SECONDS'])
+
+@job_worker.handler('broadcast_notification')
+def broadcast_notification_job(conn, payload):
+    notifications.broadcast(conn, payload['message'], payload['broadcast_id'], payload.get('role', 'customer'),
+                            app.config['BROADCAST_CHUNK_SIZE'])
+
+def enqueue_broadcast(conn, message, role='customer'):
+    with transaction(conn):
+        return jobs.enqueue(conn, 'broadcast_notification',
+                            {'message': message, 'role': role, 'broadcast_id': uuid.uuid4().hex},
+                            max_attempts=app.config['JOB_MAX_ATTEMPTS'])
+
+def get_unread_count(user_id):
+    return notifications.unread_count(get_db_connection(), user_id)
+
+@app.route('/notifications')
+def user_notifications():
+    if 'user_id' not in session:
+        return jsonify({'error': 'login required'}), 401
+    conn = get_db_connection()
+    page_size = app.config['NOTIFICATIONS_PAGE_SIZE']
+    rows = notifications.recent(conn, session['user_id'], page_size + 1, request.args.get('before', type=int))
+    next_before = rows[page_size - 1]['notification_id'] if len(rows) > page_size else None
+    return jsonify({'unread': notifications.unread_count(conn, session['user_id']),
+                    'notifications': [dict(row) for row in rows[:page_size]],
+                    'next_before': next_before})
+
+@app.route('/notifications/read', methods=['POST'])
+def mark_notifications_read():
+    if 'user_id' not in session:
+        return jsonify({'error': 'login required'}), 401
+    conn = get_db_connection()
+    marked = notifications.mark_read(conn, session['user_id'], request.form.get('up_to', type=int))
+    return jsonify({'marked': marked, 'unread': notifications.unread_count(conn, session['user_id'])})
+
+@app.route('/admin/notifications/broadcast', methods=['POST'])
+def admin_broadcast():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    message = request.form.get('message', '').strip()
+    if not message:
+        flash('Message is required.', 'danger')
+        return redirect(url_for('admin_manage'))
+    enqueue_broadcast(get_db_connection(), message)
+    job_worker.wake()
+    flash('Broadcast queued.', 'success')
+    return redirect(url_for('admin_manage'))
+
+@app.cli.command('broadcast')
+@click.argument('message')
+@click.option('--role', default='customer', show_default=True)
+@click.option('--now', 'run_now', is_flag=True, help='Send in this process instead of queueing a job.')
+def broadcast_command(message, role, run_now):
+    """Notify every user with ROLE."""
+    conn = get_db_connection()
+    if run_now:
+        sent = notifications.broadcast(conn, message, uuid.uuid4().hex, role, app.config['BROADCAST_CHUNK_SIZE'])
+        click.echo(f'Notified {sent} users.')
+    else:
+        click.echo(f'Queued broadcast job #{enqueue_broadcast(conn, message, role)}.')
+
+# -------------------- JSON API (v1) --------------------
+# Read-only catalog for the mobile and kiosk clients. Responses carry a strong
+# ETag built from the database catalog version, so a matching If-None-Match is
+# answered with 304 from the cached version alone, without touching the DB.
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+def negotiate_encoding():
+    accepted = request.headers.get('Accept-Encoding', '')
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+def select_fields(record, fields, key):
+    if not fields:
+        return record
+    return {name: value for name, value in record.items() if name in fields or name == key}
+
+def catalog_response(view):
+    """Wrap a view returning JSON-able data with ETags, field selection and compression."""
+    def wrapper(*args, **kwargs):
+        encoding = negotiate_encoding()
+        variant = hashlib.sha256(request.full_path.encode()).hexdigest()[:16]
+        etag = f'v{get_catalog_version()}-{variant}'
+        # Compressed bodies get their own strong tag; either one the client holds is still current
+        for held in (f'{etag}.{encoding}', etag) if encoding else (etag,):
+            if held in request.if_none_match:
+                response = app.response_class(status=304)
+                response.set_etag(held)
+                response.vary.add('Accept-Encoding')
+                return response
+
+        data = view(*args, **kwargs)
+        if isinstance(data, tuple):  # (body, status) for errors
+            return jsonify(data[0]), data[1]
+
+        body = json.dumps(data, separators=(',', ':')).encode()
+        response = app.response_class(body, mimetype='application/json')
+        if encoding and len(body) >= app.config['API_COMPRESS_MIN_SIZE']:
+            response.set_data(brotli.compress(body) if encoding == 'br' else gzip.compress(body, compresslevel=6))
+            response.headers['Content-Encoding'] = encoding
+            etag = f'{etag}.{encoding}'
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = 'no-cache'  # always revalidate; 304s are cheap
+        return response
+    wrapper.__name__ = view.__name__
+    return wrapper
+
+def requested_fields():
+    return {name.strip() for name in request.args.get('fields', '').split(',') if name.strip()}
+
+@api_v1.route('/categories')
+@catalog_response
+def api_categories():
+    fields = requested_fields()
+    return {'categories': [select_fields(dict(row), fields, 'category_id') for row in get_all_categories()]}
+
+@api_v1.route('/restaurants')
+@catalog_response
+def api_restaurants():
+    fields = requested_fields()
+    return {'restaurants': [select_fields(dict(row), fields, 'restaurant_id') for row in get_all_restaurants()]}
+
+@api_v1.route('/menu_items')
+@catalog_response
+def api_menu_items():
+    fields = requested_fields()
+    limit = min(max(request.args.get('limit', app.config['API_PAGE_SIZE'], type=int), 1),
+                app.config['API_MAX_PAGE_SIZE'])
+    products, next_cursor = get_product_page(
+        category_ids=sorted(set(request.args.getlist('category', type=int))),
+        restaurant_ids=sorted(set(request.args.getlist('restaurant', type=int))),
+        min_price=request.args.get('min_price', type=float),
+        max_price=request.args.get('max_price', type=float),
+        after_id=request.args.get('cursor', 0, type=int),
+        limit=limit)
+    return {
+        'menu_items': [select_fields(dict(row), fields, 'item_id') for row in products],
+        'next_cursor': next_cursor,
+    }
+
+@api_v1.route('/menu_items/<int:item_id>')
+@catalog_response
+def api_menu_item(item_id):
+    product = get_product(item_id)
+    if product is None:
+        return {'error': 'menu item not found'}, 404
+    return {'menu_item': select_fields(dict(product), requested_fields(), 'item_id')}
+
+app.register_blueprint(api_v1)
 
 # -------------------- Init DB Route --------------------
 @app.route('/initdb')
@@ -866,5 +2173,6 @@ def create_tables():
 
 # -------------------- Run Server --------------------
 if __name__ == '__main__':
-    init_db()
+    with app.app_context():
+        init_db()
     app.run(debug=True)
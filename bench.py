@@ -0,0 +1,298 @@
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import dispatch
+import inventory
+from db import transaction
+
+
+# -------------------- Scenarios --------------------
+# name -> (role, method, build(rng, ctx) -> (path, form data or None)).
+# Scenarios with a 'prepare' step run it unmeasured before each request.
+def _dashboard_filtered(rng, ctx):
+    low = rng.choice((20, 100, 200))
+    return f'/dashboard?category={rng.choice(ctx["category_ids"])}&min_price={low}&max_price={low + 150}', None
+
+
+def _dashboard_deep_page(rng, ctx):
+    return f'/dashboard?format=json&cursor={rng.randint(ctx["min_item"], ctx["max_item"])}', None
+
+
+SCENARIOS = {
+    'index': ('anonymous', 'GET', lambda rng, ctx: ('/', None)),
+    'dashboard': ('customer', 'GET', lambda rng, ctx: ('/dashboard', None)),
+    'dashboard_filtered': ('customer', 'GET', _dashboard_filtered),
+    'dashboard_deep_page': ('customer', 'GET', _dashboard_deep_page),
+    'search': ('customer', 'GET', lambda rng, ctx: (f'/search?q={rng.choice(ctx["words"])}', None)),
+    'product': ('customer', 'GET', lambda rng, ctx: (f'/product/{rng.randint(ctx["min_item"], ctx["max_item"])}', None)),
+    'profile': ('customer', 'GET', lambda rng, ctx: ('/profile', None)),
+    'cart': ('customer', 'GET', lambda rng, ctx: ('/cart', None)),
+    'add_to_cart': ('customer', 'POST', lambda rng, ctx: (
+        '/add_to_cart', {'item_id': str(rng.randint(ctx['min_item'], ctx['max_item'])), 'quantity': '1'})),
+    'place_order': ('customer', 'POST', lambda rng, ctx: ('/place_order', {'idempotency_key': uuid.uuid4().hex})),
+    'admin_overview': ('admin', 'GET', lambda rng, ctx: ('/admin/overview', None)),
+    'admin_analytics': ('admin', 'GET', lambda rng, ctx: ('/admin/analytics', None)),
+    'api_menu_items': ('anonymous', 'GET', lambda rng, ctx: (
+        f'/api/v1/menu_items?limit=50&cursor={rng.randint(ctx["min_item"], ctx["max_item"])}', None)),
+}
+
+
+def _prepare_order(client, rng, ctx):
+    # place_order needs something in the cart
+    client.post('/add_to_cart', data={'item_id': str(rng.randint(ctx['min_item'], ctx['max_item'])), 'quantity': '1'})
+
+
+PREPARE = {'place_order': _prepare_order}
+
+
+def load_context(conn, sample=10000):
+    """Ids the scenarios pick from, sampled from the database under test."""
+    items = conn.execute('SELECT MIN(item_id), MAX(item_id) FROM menu_items').fetchone()
+    customers = [row[0] for row in conn.execute(
+        "SELECT user_id FROM users WHERE role = 'customer' ORDER BY user_id DESC LIMIT ?", (sample,))]
+    admin = conn.execute("SELECT user_id FROM users WHERE role = 'admin' ORDER BY user_id LIMIT 1").fetchone()
+    if items[0] is None or not customers or admin is None:
+        raise RuntimeError('Benchmark needs menu items, customers and an admin; run seed-data first.')
+    names = conn.execute('SELECT name FROM menu_items ORDER BY item_id DESC LIMIT 200').fetchall()
+    words = sorted({word.lower() for row in names for word in row[0].split() if len(word) > 2}) or ['a']
+    return {
+        'min_item': items[0], 'max_item': items[1],
+        'category_ids': [row[0] for row in conn.execute('SELECT category_id FROM categories')],
+        'customer_ids': customers,
+        'admin_id': admin[0],
+        'words': words,
+        'counts': {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                   for table in ('restaurants', 'menu_items', 'users', 'orders', 'order_details', 'reviews', 'cart')},
+    }
+
+
+# -------------------- Measurement --------------------
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _client(app, role, rng, ctx):
+    client = app.test_client()
+    if role != 'anonymous':
+        with client.session_transaction() as sess:
+            if role == 'admin':
+                sess['admin_id'] = ctx['admin_id']
+                sess['admin_name'] = 'Admin'
+            else:
+                sess['user_id'] = rng.choice(ctx['customer_ids'])
+                sess['name'] = 'Benchmark'
+    return client
+
+
+def run_scenario(app, name, ctx, requests=200, concurrency=4, warmup=10, seed=42):
+    role, method, build = SCENARIOS[name]
+    prepare = PREPARE.get(name)
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def worker(index, count):
+        nonlocal errors
+        rng = random.Random(f'{seed}-{name}-{index}')
+        client = _client(app, role, rng, ctx)
+        for _ in range(count):
+            if prepare:
+                prepare(client, rng, ctx)
+            path, data = build(rng, ctx)
+            start = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            response.get_data()
+            elapsed = time.perf_counter() - start
+            if role != 'anonymous' and method == 'POST':
+                # Redirects leave flashes behind; don't let the session cookie grow
+                with client.session_transaction() as sess:
+                    sess.pop('_flashes', None)
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors += 1
+
+    worker(-1, warmup)
+    with lock:
+        latencies.clear()
+        errors = 0
+
+    shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker, i, share) for i, share in enumerate(shares) if share]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(app, conn, names=None, requests=200, concurrency=4, warmup=10, seed=42, progress=print):
+    """Benchmark each scenario in turn and return a JSON-serialisable report."""
+    ctx = load_context(conn)
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'requests': requests,
+            'concurrency': concurrency,
+            'warmup': warmup,
+            'seed': seed,
+            'rows': ctx['counts'],
+        },
+        'routes': {},
+    }
+    for name in names or SCENARIOS:
+        result = run_scenario(app, name, ctx, requests, concurrency, warmup, seed)
+        report['routes'][name] = result
+        progress(f'{name:<22} {result["throughput_rps"]:>9} req/s  p50 {result["p50_ms"]:>9}ms  '
+                 f'p95 {result["p95_ms"]:>9}ms  p99 {result["p99_ms"]:>9}ms  errors {result["errors"]}')
+    return report
+
+
+# -------------------- Dispatch --------------------
+def _scatter(rng, count, spread=0.08):
+    """Points within about ``spread`` degrees of the seeded cities."""
+    places = list(dispatch.PLACES.values())
+    return [(lat + rng.uniform(-spread, spread), lng + rng.uniform(-spread, spread))
+            for lat, lng in (rng.choice(places) for _ in range(count))]
+
+
+def run_dispatch(orders=10000, drivers=2000, seed=42, cell_km=2.0, max_km=15.0, brute_force=False):
+    """Time one in-memory dispatch batch; the database round trips are not included."""
+    rng = random.Random(seed)
+    batch = [(i, (lat, lng), (lat + rng.uniform(-0.04, 0.04), lng + rng.uniform(-0.04, 0.04)))
+             for i, (lat, lng) in enumerate(_scatter(rng, orders))]
+    fleet = list(enumerate(_scatter(rng, drivers)))
+    report = {'orders': orders, 'drivers': drivers, 'cell_km': cell_km, 'max_km': max_km, 'seed': seed}
+    runs = [('grid', lambda: dispatch.match(batch, fleet, cell_km, max_km))]
+    if brute_force:
+        runs.append(('brute_force', lambda: dispatch.match_brute_force(batch, fleet, max_km)))
+    for name, fn in runs:
+        start = time.perf_counter()
+        assignments, examined = fn()
+        elapsed = time.perf_counter() - start
+        report[name] = {
+            'seconds': round(elapsed, 4),
+            'orders_per_second': round(orders / elapsed, 1) if elapsed else None,
+            'assigned': len(assignments),
+            'drivers_examined_per_order': round(examined / orders, 2),
+            'mean_pickup_km': round(sum(a[2] for a in assignments) / len(assignments), 3) if assignments else None,
+            'mean_eta_minutes': round(sum(a[3] for a in assignments) / len(assignments), 1) if assignments else None,
+        }
+    return report
+
+
+# -------------------- Stock Contention --------------------
+def run_stock_contention(app, conn, item_id=None, stock=100, checkouts=500, concurrency=16):
+    """Many customers check out one unit of the same item at once.
+
+    Each worker is a distinct customer adding the item and placing an order, so
+    every checkout races for the same inventory row. Reports throughput and
+    latency per checkout and how many units were sold against the stock given.
+    """
+    ctx = load_context(conn)
+    if len(ctx['customer_ids']) < concurrency:
+        raise RuntimeError(f'Need at least {concurrency} customers; run seed-data first.')
+    item_id = item_id or ctx['min_item']
+    with transaction(conn):
+        inventory.set_stock(conn, item_id, stock)
+        conn.executemany('DELETE FROM cart WHERE user_id = ?', [(uid,) for uid in ctx['customer_ids'][:concurrency]])
+    last_order = conn.execute('SELECT COALESCE(MAX(order_id), 0) FROM orders').fetchone()[0]
+
+    latencies, placed, refused, errors = [], 0, 0, 0
+    lock = threading.Lock()
+
+    def worker(index, count):
+        nonlocal placed, refused, errors
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = ctx['customer_ids'][index]
+            sess['name'] = 'Benchmark'
+        for _ in range(count):
+            client.post('/add_to_cart', data={'item_id': str(item_id), 'quantity': '1'})
+            start = time.perf_counter()
+            response = client.post('/place_order', data={'idempotency_key': uuid.uuid4().hex})
+            elapsed = time.perf_counter() - start
+            with client.session_transaction() as sess:
+                sess.pop('_flashes', None)
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors += 1
+                elif response.location and response.location.endswith('/cart'):
+                    refused += 1
+                else:
+                    placed += 1
+
+    shares = [checkouts // concurrency + (1 if i < checkouts % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker, i, share) for i, share in enumerate(shares) if share]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    sold = conn.execute('SELECT COALESCE(SUM(quantity), 0) FROM order_details WHERE item_id = ? AND order_id > ?',
+                        (item_id, last_order)).fetchone()[0]
+    left = conn.execute('SELECT stock FROM inventory WHERE item_id = ?', (item_id,)).fetchone()[0]
+    latencies.sort()
+    return {
+        'item_id': item_id, 'stock': stock, 'checkouts': len(latencies), 'concurrency': concurrency,
+        'placed': placed, 'sold_out_refusals': refused, 'errors': errors,
+        'units_sold': sold, 'stock_left': left, 'oversold': max(0, sold - stock),
+        'consistent': sold + left == stock,
+        'throughput_cps': round(len(latencies) / wall, 2) if wall else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def compare(previous, current):
+    """Lines describing the p50/p95 change per route against an earlier report."""
+    lines = []
+    for name, result in current['routes'].items():
+        before = previous.get('routes', {}).get(name)
+        if not before:
+            continue
+        deltas = []
+        for key in ('p50_ms', 'p95_ms'):
+            change = (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            deltas.append(f'{key[:3]} {before[key]}ms -> {result[key]}ms ({change:+.1f}%)')
+        lines.append(f'{name:<22} ' + '  '.join(deltas))
+    return lines
+
+
+def save(report, path):
+    with open(path, 'w') as out:
+        json.dump(report, out, indent=2)
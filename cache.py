@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """A small thread-safe LRU cache with per-entry TTL and a version counter.
+
+    Writers call ``invalidate()`` after committing; that drops every entry and
+    bumps ``version`` so a load that raced with the write is not stored.
+    ``discard(key)`` does the same for a single key without disturbing loads of
+    other keys.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._loading = {}  # key -> number of loads in flight
+        self._stale = set()  # keys discarded while a load was in flight
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            version = self.version
+            self._loading[key] = self._loading.get(key, 0) + 1
+
+        try:
+            value = loader()
+        finally:
+            with self._lock:
+                stale = key in self._stale
+                self._loading[key] -= 1
+                if not self._loading[key]:
+                    del self._loading[key]
+                    self._stale.discard(key)
+
+        with self._lock:
+            if version == self.version and not stale:
+                self._entries[key] = (now + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            if key in self._loading:
+                self._stale.add(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self.version,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,162 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# -------------------- Connection Tuning --------------------
+# Applied once per connection when it is opened, not per request.
+PRAGMAS = (
+    ('journal_mode', 'WAL'),          # readers no longer block behind writers
+    ('synchronous', 'NORMAL'),        # safe with WAL, far fewer fsyncs
+    ('cache_size', -64 * 1024),       # negative = KiB, i.e. 64 MiB page cache
+    ('mmap_size', 256 * 1024 * 1024),
+    ('busy_timeout', 5000),           # ms to wait on the writer lock
+    ('temp_store', 'MEMORY'),
+)
+
+
+class PoolExhausted(RuntimeError):
+    pass
+
+
+# -------------------- Statement Timing --------------------
+# Handlers use both conn.execute() and cursor.execute(), so both are timed. The
+# time is that of sqlite3's execute step (up to the first row), not later fetches.
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.observe_statement(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.observe_statement(sql, None, time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    observer = None  # callable(conn, sql, parameters, seconds); parameters is None for executemany
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def observe_statement(self, sql, parameters, seconds):
+        if self.observer is not None:
+            self.observer(self, sql, parameters, seconds)
+
+
+@contextmanager
+def transaction(conn, mode='IMMEDIATE'):
+    """Run a block as one explicit transaction.
+
+    IMMEDIATE takes the write lock up front, so a read-then-write block can't
+    fail halfway with ``database is locked`` when another writer got there first.
+    Blocks don't nest: work the caller left uncommitted on ``conn`` is an error
+    rather than something to commit on its behalf.
+    """
+    if conn.in_transaction:
+        raise sqlite3.ProgrammingError('transaction() started with a transaction already open on this connection')
+    conn.execute(f'BEGIN {mode}')
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+class ConnectionPool:
+    """A per-process pool of tuned SQLite connections.
+
+    Connections are created lazily up to ``max_size`` and handed out LIFO so the
+    hottest (best cached) connection is reused first. When the process forks
+    (e.g. pre-fork WSGI workers) the pool notices the new pid and starts fresh,
+    so each worker owns its own connections.
+    """
+
+    def __init__(self, database, max_size=8, timeout=30.0, cached_statements=256, observer=None):
+        self.database = database
+        self.observer = observer
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.timeout,
+                               check_same_thread=False,
+                               cached_statements=self.cached_statements,
+                               factory=TimedConnection)
+        conn.observer = self.observer
+        conn.row_factory = sqlite3.Row
+        for name, value in PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            if self._created < self.max_size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolExhausted(f'No database connection available after {self.timeout}s') from None
+
+    def release(self, conn):
+        if self._pid != os.getpid():
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connection: drop it and let the pool open a new one later.
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._created -= 1
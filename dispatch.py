@@ -0,0 +1,312 @@
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from db import transaction
+
+log = logging.getLogger(__name__)
+
+# -------------------- Locations --------------------
+# Restaurant locations and customer addresses are free text. Text containing
+# "lat, lng" is taken literally; otherwise a known place name is looked up.
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LNG = 111.320  # at the equator
+PLACES = {
+    'quezon city': (14.6760, 121.0437), 'manila': (14.5995, 120.9842), 'makati': (14.5547, 121.0244),
+    'magallanes': (14.5361, 121.0170), 'pasig': (14.5764, 121.0851), 'taguig': (14.5176, 121.0509),
+    'cebu': (10.3157, 123.8854), 'davao': (7.1907, 125.4553), 'iloilo': (10.7202, 122.5621),
+    'baguio': (16.4023, 120.5960), 'bacolod': (10.6765, 122.9509),
+}
+COORDINATES = re.compile(r'(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)')
+
+
+@lru_cache(maxsize=65536)
+def locate(text):
+    """(lat, lng) for a location or address string, or None if it can't be placed."""
+    if not text:
+        return None
+    match = COORDINATES.search(text)
+    if match:
+        lat, lng = float(match.group(1)), float(match.group(2))
+        if -90 <= lat <= 90 and -180 <= lng <= 180:
+            return lat, lng
+    lowered = text.lower()
+    for name in sorted(PLACES, key=len, reverse=True):
+        if name in lowered:
+            return PLACES[name]
+    return None
+
+
+def distance_km(a, b):
+    """Great-circle distance between two (lat, lng) points."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 12742.0 * math.asin(math.sqrt(h))
+
+
+# -------------------- Spatial Grid --------------------
+class SpatialGrid:
+    """Points bucketed into roughly ``cell_km`` square cells for nearest-neighbour search.
+
+    Cell width in longitude is fixed at ``ref_lat``, so cells drift from square
+    away from it; ``nearest`` allows for that when deciding it can stop.
+    """
+
+    def __init__(self, cell_km=2.0, ref_lat=0.0):
+        self.cell_km = cell_km
+        self.cell_lat = cell_km / KM_PER_DEG_LAT
+        self.cell_lng = cell_km / (KM_PER_DEG_LNG * max(math.cos(math.radians(ref_lat)), 0.01))
+        self.cells = defaultdict(dict)
+        self.size = 0
+
+    def _key(self, point):
+        return math.floor(point[0] / self.cell_lat), math.floor(point[1] / self.cell_lng)
+
+    def add(self, key, point, item=None):
+        self.cells[self._key(point)][key] = (point, item)
+        self.size += 1
+
+    def remove(self, key, point):
+        cell = self.cells.get(self._key(point))
+        if cell and cell.pop(key, None) is not None:
+            self.size -= 1
+            if not cell:
+                del self.cells[self._key(point)]
+
+    def nearest(self, point, max_km):
+        """(key, point, item, km, points examined) of the closest entry within ``max_km``, key None if none."""
+        cx, cy = self._key(point)
+        best, best_km, examined = None, math.inf, 0
+        # Anything in ring r is at least (r - 1) cells away; 0.9 covers cells narrower than cell_km
+        max_ring = int(max_km / (self.cell_km * 0.9)) + 1
+        for ring in range(max_ring + 1):
+            if self.size == examined or (ring - 1) * self.cell_km * 0.9 > min(best_km, max_km):
+                break
+            for dx in range(-ring, ring + 1):
+                for dy in (range(-ring, ring + 1) if abs(dx) == ring else (-ring, ring) if ring else (0,)):
+                    cell = self.cells.get((cx + dx, cy + dy))
+                    if not cell:
+                        continue
+                    for key, (other, item) in cell.items():
+                        examined += 1
+                        km = distance_km(point, other)
+                        if km < best_km and km <= max_km:
+                            best, best_km = (key, other, item), km
+        if best is None:
+            return None, None, None, None, examined
+        return best + (best_km, examined)
+
+
+# -------------------- Matching --------------------
+def eta_minutes(pickup_km, dropoff_km, speed_kmh, prep_minutes):
+    """The driver rides to the restaurant while the food is prepared, then on to the customer."""
+    return max(prep_minutes, pickup_km / speed_kmh * 60) + dropoff_km / speed_kmh * 60
+
+
+def match(orders, drivers, cell_km=2.0, max_km=15.0, speed_kmh=25.0, prep_minutes=15.0, default_dropoff_km=3.0):
+    """Greedily give each order, oldest first, the nearest free driver to its restaurant.
+
+    ``orders`` are (key, pickup point, drop-off point or None) in priority order
+    and ``drivers`` are (driver_id, point). Each lookup only looks at drivers in
+    the grid cells around the pickup, so a batch costs about orders x nearby
+    drivers rather than orders x drivers. Returns ([(order key, driver_id,
+    pickup km, eta minutes)], drivers examined).
+    """
+    if not orders or not drivers:
+        return [], 0
+    ref_lat = sum(order[1][0] for order in orders) / len(orders)
+    grid = SpatialGrid(cell_km, ref_lat)
+    for driver_id, point in drivers:
+        grid.add(driver_id, point)
+    assignments, examined = [], 0
+    for key, pickup, dropoff in orders:
+        if not grid.size:
+            break
+        driver_id, point, _, km, seen = grid.nearest(pickup, max_km)
+        examined += seen
+        if driver_id is None:
+            continue
+        grid.remove(driver_id, point)
+        dropoff_km = distance_km(pickup, dropoff) if dropoff else default_dropoff_km
+        assignments.append((key, driver_id, km, eta_minutes(km, dropoff_km, speed_kmh, prep_minutes)))
+    return assignments, examined
+
+
+def match_brute_force(orders, drivers, max_km=15.0, speed_kmh=25.0, prep_minutes=15.0, default_dropoff_km=3.0):
+    """The same greedy matching by scanning every free driver per order (benchmark baseline)."""
+    free = dict(drivers)
+    assignments, examined = [], 0
+    for key, pickup, dropoff in orders:
+        best, best_km = None, math.inf
+        for driver_id, point in free.items():
+            km = distance_km(pickup, point)
+            if km < best_km and km <= max_km:
+                best, best_km = driver_id, km
+        examined += len(free)
+        if best is None:
+            continue
+        del free[best]
+        dropoff_km = distance_km(pickup, dropoff) if dropoff else default_dropoff_km
+        assignments.append((key, best, best_km, eta_minutes(best_km, dropoff_km, speed_kmh, prep_minutes)))
+    return assignments, examined
+
+
+# -------------------- Dispatcher --------------------
+AWAITING = 'Awaiting driver'
+ASSIGNED = 'Assigned'
+
+
+class Dispatcher:
+    """Assigns deliveries awaiting a driver in periodic batches on a daemon thread.
+
+    Each batch reads a snapshot, matches in memory and then writes every
+    assignment in one transaction, guarded so a driver or delivery taken
+    meanwhile (by another worker process) is skipped rather than double
+    booked. ``on_assigned(conn, order_ids)`` runs after the commit.
+    """
+
+    def __init__(self, pool_getter, interval=5.0, batch_size=10000, cell_km=2.0, max_km=15.0,
+                 speed_kmh=25.0, prep_minutes=15.0, default_location=PLACES['manila'], on_assigned=None):
+        self.pool_getter = pool_getter
+        self.interval = interval
+        self.batch_size = batch_size
+        self.cell_km = cell_km
+        self.max_km = max_km
+        self.speed_kmh = speed_kmh
+        self.prep_minutes = prep_minutes
+        self.default_location = default_location
+        self.on_assigned = on_assigned
+        self.last_batch = None
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def ensure_started(self):
+        if self.interval <= 0 or (self._pid == os.getpid() and self._thread is not None):
+            return
+        with self._wakeup:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='dispatcher', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def _loop(self):
+        while True:
+            with self._wakeup:
+                self._wakeup.wait(self.interval)
+            pool = self.pool_getter()
+            conn = pool.acquire()
+            try:
+                self.run_batch(conn)
+            except Exception:
+                log.exception('Dispatch batch failed')
+                if conn.in_transaction:
+                    conn.rollback()
+            finally:
+                pool.release(conn)
+
+    def pending(self, conn):
+        # The restaurant of the first line is the pickup point
+        return conn.execute('''
+            SELECT d.delivery_id, d.order_id, u.address,
+                   (SELECT r.location FROM order_details od
+                    JOIN menu_items m ON m.item_id = od.item_id
+                    JOIN restaurants r ON r.restaurant_id = m.restaurant_id
+                    WHERE od.order_id = d.order_id ORDER BY od.detail_id LIMIT 1) AS pickup
+            FROM delivery d
+            JOIN orders o ON o.order_id = d.order_id
+            LEFT JOIN users u ON u.user_id = o.user_id
+            WHERE d.delivery_status = ?
+            ORDER BY d.delivery_id LIMIT ?
+        ''', (AWAITING, self.batch_size)).fetchall()
+
+    def run_batch(self, conn):
+        """Assign one batch; returns a summary that is also kept as ``last_batch``."""
+        started = time.perf_counter()
+        rows = self.pending(conn)
+        drivers = conn.execute(
+            "SELECT driver_id, name, latitude, longitude FROM drivers WHERE status = 'available'").fetchall()
+        names = {row['driver_id']: row['name'] for row in drivers}
+        orders = {row['delivery_id']: row for row in rows}
+        assignments, examined = match(
+            [(row['delivery_id'], locate(row['pickup']) or self.default_location, locate(row['address']))
+             for row in rows],
+            [(row['driver_id'], (row['latitude'], row['longitude']) if row['latitude'] is not None
+              else self.default_location) for row in drivers],
+            self.cell_km, self.max_km, self.speed_kmh, self.prep_minutes)
+        matched = time.perf_counter()
+
+        now = datetime.now()
+        assigned = []
+        if assignments:
+            with transaction(conn):
+                for delivery_id, driver_id, _, eta in assignments:
+                    if not conn.execute('''
+                        UPDATE drivers SET status = 'busy', delivery_id = ?, updated_at = ?
+                        WHERE driver_id = ? AND status = 'available'
+                    ''', (delivery_id, now.strftime('%Y-%m-%d %H:%M:%S'), driver_id)).rowcount:
+                        continue
+                    if not conn.execute('''
+                        UPDATE delivery SET driver_id = ?, driver_name = ?, delivery_status = ?, estimated_time = ?,
+                               assigned_at = ?
+                        WHERE delivery_id = ? AND delivery_status = ?
+                    ''', (driver_id, names[driver_id], ASSIGNED,
+                          (now + timedelta(minutes=eta)).strftime('%Y-%m-%d %H:%M'),
+                          now.strftime('%Y-%m-%d %H:%M:%S'), delivery_id, AWAITING)).rowcount:
+                        conn.execute("UPDATE drivers SET status = 'available', delivery_id = NULL WHERE driver_id = ?",
+                                     (driver_id,))
+                        continue
+                    assigned.append(orders[delivery_id]['order_id'])
+        if assigned and self.on_assigned:
+            self.on_assigned(conn, assigned)
+
+        elapsed = time.perf_counter() - started
+        self.last_batch = {
+            'at': now.isoformat(timespec='seconds'), 'pending': len(rows), 'available_drivers': len(drivers),
+            'assigned': len(assigned), 'drivers_examined_per_order': round(examined / len(rows), 2) if rows else 0,
+            'match_seconds': round(matched - started, 4), 'total_seconds': round(elapsed, 4),
+        }
+        return self.last_batch
+
+
+def release_driver(conn, order_id, delivery_status, position=None):
+    """Finish the order's delivery and free its driver, moving them to ``position`` if known.
+
+    Only a delivery still awaiting a driver or assigned to one is finished, and
+    the driver is only freed while they are still on this delivery, so finishing
+    an order twice can't release a driver who has since been dispatched again.
+    Call inside the caller's transaction.
+    """
+    row = conn.execute('''
+        UPDATE delivery SET delivery_status = ?
+        WHERE delivery_id = (SELECT delivery_id FROM orders WHERE order_id = ?) AND delivery_status IN (?, ?)
+        RETURNING delivery_id, driver_id
+    ''', (delivery_status, order_id, AWAITING, ASSIGNED)).fetchone()
+    if row is None or row['driver_id'] is None:
+        return None
+    if not conn.execute('''
+        UPDATE drivers SET status = 'available', delivery_id = NULL, updated_at = ?,
+               latitude = COALESCE(?, latitude), longitude = COALESCE(?, longitude)
+        WHERE driver_id = ? AND status = 'busy' AND delivery_id = ?
+    ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), position[0] if position else None,
+          position[1] if position else None, row['driver_id'], row['delivery_id'])).rowcount:
+        return None
+    return row['driver_id']
+
+
+def driver_stats(conn):
+    counts = dict(conn.execute('SELECT status, COUNT(*) FROM drivers GROUP BY status').fetchall())
+    awaiting = conn.execute('SELECT COUNT(*) FROM delivery WHERE delivery_status = ?', (AWAITING,)).fetchone()[0]
+    return {'available': counts.get('available', 0), 'busy': counts.get('busy', 0),
+            'offline': counts.get('offline', 0), 'awaiting_driver': awaiting}
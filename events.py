@@ -0,0 +1,117 @@
+import itertools
+import json
+import threading
+from collections import OrderedDict, deque
+
+
+class TooManySubscribers(RuntimeError):
+    pass
+
+
+class Subscription:
+    """One listener's mailbox. Idle subscribers just wait on a condition."""
+
+    def __init__(self, hub, topic):
+        self.hub = hub
+        self.topic = topic
+        self._pending = deque()
+        self._ready = threading.Condition()
+
+    def _deliver(self, event):
+        with self._ready:
+            self._pending.append(event)
+            self._ready.notify()
+
+    def get(self, timeout):
+        """Next (id, name, data) event, or None if nothing arrived within ``timeout`` seconds."""
+        with self._ready:
+            if not self._pending:
+                self._ready.wait(timeout)
+            return self._pending.popleft() if self._pending else None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class EventHub:
+    """In-process publish/subscribe for server-sent events.
+
+    Events get ids from a single per-process sequence, and the last few per topic
+    are kept so a client reconnecting with Last-Event-ID can be replayed what it
+    missed. Each process (WSGI worker) has its own hub and subscriber cap.
+    """
+
+    def __init__(self, max_subscribers=100, history=20, max_topics=10000):
+        self.max_subscribers = max_subscribers
+        self.history = history
+        self.max_topics = max_topics
+        self._ids = itertools.count(1)
+        self._subscribers = {}  # topic -> set of Subscription
+        self._recent = OrderedDict()  # topic -> [deque of (id, name, data), id of last dropped event]
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers(f'{self._count} subscribers already connected')
+            subscription = Subscription(self, topic)
+            self._subscribers.setdefault(topic, set()).add(subscription)
+            self._count += 1
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            listeners = self._subscribers.get(subscription.topic)
+            if listeners and subscription in listeners:
+                listeners.discard(subscription)
+                self._count -= 1
+                if not listeners:
+                    del self._subscribers[subscription.topic]
+
+    def publish(self, topic, name, data):
+        with self._lock:
+            event = (next(self._ids), name, data)
+            entry = self._recent.get(topic)
+            if entry is None:
+                entry = self._recent[topic] = [deque(maxlen=self.history), 0]
+                while len(self._recent) > self.max_topics:
+                    self._recent.popitem(last=False)
+            else:
+                self._recent.move_to_end(topic)
+            if len(entry[0]) == self.history:
+                entry[1] = entry[0][0][0]
+            entry[0].append(event)
+            listeners = list(self._subscribers.get(topic, ()))
+        for subscription in listeners:
+            subscription._deliver(event)
+        return event[0]
+
+    def since(self, topic, last_id):
+        """Events on ``topic`` newer than ``last_id``.
+
+        None means the retained history can't prove nothing was missed (unknown
+        topic, or events after ``last_id`` already dropped); send a snapshot instead.
+        """
+        with self._lock:
+            entry = self._recent.get(topic)
+            if entry is None or last_id < entry[1]:
+                return None
+            return [event for event in entry[0] if event[0] > last_id]
+
+    def stats(self):
+        with self._lock:
+            return {'subscribers': self._count, 'max_subscribers': self.max_subscribers,
+                    'topics': len(self._subscribers), 'retained_topics': len(self._recent)}
+
+
+def format_event(event_id, name, data, retry=None):
+    """Encode one server-sent event."""
+    lines = []
+    if retry is not None:
+        lines.append(f'retry: {retry}')
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {name}')
+    lines.extend(f'data: {line}' for line in json.dumps(data).splitlines())
+    return '\n'.join(lines) + '\n\n'
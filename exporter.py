@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+# -------------------- Order Export --------------------
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+ORDER_FIELDS = ('order_id', 'order_date', 'order_status', 'user_id', 'customer_email', 'total_amount',
+                'payment_method', 'payment_status', 'payment_date',
+                'driver_name', 'delivery_status', 'estimated_time')
+LINE_FIELDS = ('detail_id', 'item_id', 'item_name', 'quantity', 'unit_price', 'subtotal')
+
+
+def parse_filters(from_date=None, to_date=None, status=None):
+    """Validate YYYY-MM-DD bounds (both inclusive) into SQL-ready filters."""
+    filters = {'status': status or None, 'start': None, 'end': None}
+    try:
+        if from_date:
+            filters['start'] = datetime.strptime(from_date, '%Y-%m-%d').strftime('%Y-%m-%d')
+        if to_date:
+            filters['end'] = (datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError('Dates must be YYYY-MM-DD') from None
+    return filters
+
+
+def _order_id_chunks(conn, filters, chunk_size):
+    """Yield lists of matching order ids, walking the primary key in chunks."""
+    clauses, params = [], []
+    if filters['start']:
+        clauses.append('order_date >= ?')
+        params.append(filters['start'])
+    if filters['end']:
+        clauses.append('order_date < ?')
+        params.append(filters['end'])
+    if filters['status']:
+        clauses.append('order_status = ?')
+        params.append(filters['status'])
+    where = ''.join(f' AND {clause}' for clause in clauses)
+
+    last_id = 0
+    while True:
+        ids = [row[0] for row in conn.execute(
+            f'SELECT order_id FROM orders WHERE order_id > ?{where} ORDER BY order_id LIMIT ?',
+            [last_id, *params, chunk_size])]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def iter_orders(conn, filters, chunk_size=500):
+    """Yield (order dict, [line dicts]) in order_id order, one short query per chunk.
+
+    Each chunk is read and released before the next, so memory stays flat and no
+    read transaction is held open for the length of the export.
+    """
+    for ids in _order_id_chunks(conn, filters, chunk_size):
+        placeholders = ', '.join('?' * len(ids))
+        rows = conn.execute(f'''
+            SELECT o.order_id, o.order_date, o.order_status, o.user_id, u.email AS customer_email,
+                   o.total_amount, p.payment_method, p.payment_status, p.date AS payment_date,
+                   d.driver_name, d.delivery_status, d.estimated_time,
+                   od.detail_id, od.item_id, m.name AS item_name, od.quantity, od.unit_price, od.subtotal
+            FROM orders o
+            LEFT JOIN users u ON u.user_id = o.user_id
+            LEFT JOIN payments p ON p.payment_id = o.payment_id
+            LEFT JOIN delivery d ON d.delivery_id = o.delivery_id
+            LEFT JOIN order_details od ON od.order_id = o.order_id
+            LEFT JOIN menu_items m ON m.item_id = od.item_id
+            WHERE o.order_id IN ({placeholders})
+            ORDER BY o.order_id, od.detail_id
+        ''', ids).fetchall()
+
+        order, lines = None, []
+        for row in rows:
+            if order is None or order['order_id'] != row['order_id']:
+                if order is not None:
+                    yield order, lines
+                order, lines = {field: row[field] for field in ORDER_FIELDS}, []
+            if row['detail_id'] is not None:
+                lines.append({field: row[field] for field in LINE_FIELDS})
+        if order is not None:
+            yield order, lines
+
+
+def render_csv(orders):
+    """One CSV row per order line (orders without lines get one row), header first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ORDER_FIELDS + LINE_FIELDS)
+    for order, lines in orders:
+        order_values = [order[field] for field in ORDER_FIELDS]
+        for line in lines or [dict.fromkeys(LINE_FIELDS)]:
+            writer.writerow(order_values + [line[field] for field in LINE_FIELDS])
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render_jsonl(orders):
+    """One JSON object per order with its lines nested under "items"."""
+    for order, lines in orders:
+        yield json.dumps(order | {'items': lines}) + '\n'
+
+
+RENDERERS = {'csv': render_csv, 'jsonl': render_jsonl}
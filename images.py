@@ -0,0 +1,147 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+log = logging.getLogger(__name__)
+
+# -------------------- Variants --------------------
+# (name, max width in px). Each upload gets every size as WebP plus, for JPEG and
+# PNG, in its own format for browsers without WebP.
+VARIANTS = (('thumb', 160), ('card', 480), ('detail', 1200))
+FALLBACK_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG'}
+
+
+def variant_name(filename, variant, ext=None):
+    stem, original_ext = os.path.splitext(filename)
+    return f'{stem}.{variant}{ext or original_ext.lower()}'
+
+
+# -------------------- Content-Addressed Storage --------------------
+# Uploads are named by the SHA-256 of their bytes, so a name never changes
+# meaning (safe to cache forever) and identical files are stored once.
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}(\.(?:%s))?\.[a-z0-9]+$' % '|'.join(v for v, _ in VARIANTS))
+CHUNK_SIZE = 64 * 1024
+
+
+def store_upload(stream, folder, ext):
+    """Stream ``stream`` into ``folder`` under its content hash.
+
+    Returns ``(filename, size, created)``; ``created`` is False when an identical
+    file was already stored.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        filename = digest.hexdigest() + ext.lower()
+        target = os.path.join(folder, filename)
+        if os.path.exists(target):
+            os.remove(temp)
+            return filename, size, False
+        os.replace(temp, target)
+        return filename, size, True
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+class ImagePipeline:
+    """Resizes uploads into fixed-size variants on a background thread pool.
+
+    Request handlers save the original and call ``submit()``; everything else
+    happens off the request thread. Variants are written next to the original
+    and only become visible (via ``variants()``) once all of them exist.
+    """
+
+    def __init__(self, folder, max_workers=2):
+        self.folder = folder
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._ready = set()
+
+    def _get_executor(self):
+        with self._lock:
+            # A forked worker can't use the parent's threads; start its own pool
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='image-pipeline')
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, filename):
+        # A re-upload under the same name must not keep serving the old variants
+        self.discard(filename)
+        return self._get_executor().submit(self.process, filename)
+
+    def process(self, filename):
+        source = os.path.join(self.folder, filename)
+        fallback = FALLBACK_FORMATS.get(os.path.splitext(filename)[1].lower())
+        try:
+            with Image.open(source) as original:
+                image = ImageOps.exif_transpose(original)
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+                for variant, width in VARIANTS:
+                    resized = image.copy()
+                    resized.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+                    self._save(resized, variant_name(filename, variant, '.webp'), 'WEBP', quality=80, method=4)
+                    if fallback == 'JPEG':
+                        self._save(resized.convert('RGB'), variant_name(filename, variant), 'JPEG',
+                                   quality=82, optimize=True, progressive=True)
+                    elif fallback == 'PNG':
+                        self._save(resized, variant_name(filename, variant), 'PNG', optimize=True)
+        except Exception:
+            log.exception('Could not build image variants for %s', filename)
+            return False
+
+        with self._lock:
+            self._ready.add(filename)
+        return True
+
+    def _save(self, image, name, fmt, **options):
+        # Write to a temp file and rename so readers never see a half-written variant
+        target = os.path.join(self.folder, name)
+        temp = f'{target}.tmp'
+        image.save(temp, fmt, **options)
+        os.replace(temp, target)
+
+    def variants(self, filename):
+        """Return {'webp': [(name, width)], 'fallback': [(name, width)]} once processed, else None."""
+        if not filename:
+            return None
+        if filename not in self._ready:
+            last = variant_name(filename, VARIANTS[-1][0], '.webp')
+            if not os.path.exists(os.path.join(self.folder, last)):
+                return None
+            with self._lock:
+                self._ready.add(filename)
+
+        has_fallback = os.path.splitext(filename)[1].lower() in FALLBACK_FORMATS
+        return {
+            'webp': [(variant_name(filename, variant, '.webp'), width) for variant, width in VARIANTS],
+            'fallback': [(variant_name(filename, variant), width) for variant, width in VARIANTS] if has_fallback else [],
+        }
+
+    def discard(self, filename):
+        with self._lock:
+            self._ready.discard(filename)
+        for variant, _ in VARIANTS:
+            for name in (variant_name(filename, variant, '.webp'), variant_name(filename, variant)):
+                try:
+                    os.remove(os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    pass
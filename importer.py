@@ -0,0 +1,185 @@
+import csv
+import io
+import json
+import sqlite3
+
+from db import transaction
+
+# -------------------- Readers --------------------
+FORMATS = ('csv', 'jsonl')
+MAX_REPORTED_ERRORS = 200  # later errors are counted but not kept
+
+
+def detect_format(filename):
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}.get(ext)
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict or error message) from a binary stream, one row at a time."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {key.strip().lower(): (value or '').strip()
+                                    for key, value in row.items() if key is not None}
+        return
+    for line_num, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_num, f'invalid JSON: {exc}'
+            continue
+        if not isinstance(row, dict):
+            yield line_num, 'expected a JSON object'
+            continue
+        yield line_num, {str(key).strip().lower(): '' if value is None else str(value).strip()
+                         for key, value in row.items()}
+
+
+# -------------------- Row Validation --------------------
+class RowError(ValueError):
+    pass
+
+
+def _required(row, field):
+    value = row.get(field, '')
+    if not value:
+        raise RowError(f'missing {field}')
+    return value
+
+
+def _lookup(row, field, table, maps):
+    """Resolve ``field`` (a name) or ``field_id`` (an id) against the maps for ``table``."""
+    if row.get(f'{field}_id'):
+        try:
+            value = int(row[f'{field}_id'])
+        except ValueError:
+            raise RowError(f'invalid {field}_id {row[f"{field}_id"]!r}') from None
+        if value not in maps[f'{field}_ids']:
+            raise RowError(f'unknown {field}_id {value}')
+        return value
+    name = _required(row, field)
+    try:
+        return maps[table][name.lower()]
+    except KeyError:
+        raise RowError(f'unknown {field} {name!r}') from None
+
+
+def _category_row(row, maps):
+    name = _required(row, 'name')
+    if name.lower() in maps['categories']:
+        return None
+    maps['categories'][name.lower()] = None  # reserve; duplicates later in the file are skipped
+    return (name,)
+
+
+def _restaurant_row(row, maps):
+    name = _required(row, 'name')
+    if name.lower() in maps['restaurants']:
+        return None
+    maps['restaurants'][name.lower()] = None
+    return (name, row.get('location') or None, row.get('contact') or None)
+
+
+def _menu_item_row(row, maps):
+    name = _required(row, 'name')
+    try:
+        price = float(_required(row, 'price'))
+    except ValueError:
+        raise RowError(f'invalid price {row["price"]!r}') from None
+    if price < 0:
+        raise RowError('price must not be negative')
+    return (name, row.get('description', ''), price, _lookup(row, 'category', 'categories', maps),
+            _lookup(row, 'restaurant', 'restaurants', maps), row.get('image') or None)
+
+
+# kind -> (INSERT statement, row builder). A builder returns None to skip a row.
+KINDS = {
+    'categories': ('INSERT INTO categories (name) VALUES (?)', _category_row),
+    'restaurants': ('INSERT INTO restaurants (name, location, contact) VALUES (?, ?, ?)', _restaurant_row),
+    'menu_items': ('''
+        INSERT INTO menu_items (name, description, price, category_id, restaurant_id, image)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', _menu_item_row),
+}
+
+
+def load_maps(conn):
+    """Lower-cased name -> id (first id wins) and the set of ids, per lookup table."""
+    maps = {}
+    for table, key in (('categories', 'category_id'), ('restaurants', 'restaurant_id')):
+        names, ids = {}, set()
+        for row in conn.execute(f'SELECT {key}, name FROM {table} ORDER BY {key}'):
+            ids.add(row[0])
+            if row[1] is not None:
+                names.setdefault(row[1].lower(), row[0])
+        maps[table], maps[key + 's'] = names, ids
+    return maps
+
+
+# -------------------- Import --------------------
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []  # (line number, message), capped at MAX_REPORTED_ERRORS
+
+    def error(self, line_num, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_num, message))
+
+    def as_dict(self):
+        return {'inserted': self.inserted, 'skipped': self.skipped, 'failed': self.failed,
+                'errors': [{'line': line, 'message': message} for line, message in self.errors]}
+
+
+def _flush(conn, sql, batch, result):
+    try:
+        with transaction(conn):
+            conn.executemany(sql, [values for _, values in batch])
+        result.inserted += len(batch)
+    except sqlite3.DatabaseError:
+        # Find the offending rows: retry one by one so the rest still go in
+        for line_num, values in batch:
+            try:
+                with transaction(conn):
+                    conn.execute(sql, values)
+                result.inserted += 1
+            except sqlite3.DatabaseError as exc:
+                result.error(line_num, str(exc))
+
+
+def import_rows(conn, kind, rows, batch_size=1000):
+    """Insert (line number, row) pairs from read_rows() in batched transactions.
+
+    Bad rows are reported in the result and never abort the import. Only one
+    batch is held in memory at a time.
+    """
+    sql, build = KINDS[kind]
+    maps = load_maps(conn)
+    result = ImportResult()
+    batch = []
+    for line_num, row in rows:
+        if isinstance(row, str):
+            result.error(line_num, row)
+            continue
+        try:
+            values = build(row, maps)
+        except RowError as exc:
+            result.error(line_num, str(exc))
+            continue
+        if values is None:
+            result.skipped += 1
+            continue
+        batch.append((line_num, values))
+        if len(batch) >= batch_size:
+            _flush(conn, sql, batch, result)
+            batch = []
+    if batch:
+        _flush(conn, sql, batch, result)
+    return result
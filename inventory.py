@@ -0,0 +1,140 @@
+# -------------------- Stock --------------------
+# Items with a row in inventory are tracked: 'stock' is what is left to sell
+# (NULL: unlimited) and 'daily_limit' caps units sold per calendar day, counted
+# in daily_sales. Items without a row sell without limit.
+
+
+class OutOfStock(Exception):
+    def __init__(self, item_id, name, available):
+        super().__init__(f'Only {available} of {name or f"item #{item_id}"} left.' if available
+                         else f'{name or f"Item #{item_id}"} is sold out.')
+        self.item_id = item_id
+        self.available = available
+
+
+def _available(stock, daily_limit, sold_today):
+    limits = [value for value in (stock, None if daily_limit is None else daily_limit - sold_today)
+              if value is not None]
+    return max(0, min(limits)) if limits else None
+
+
+def levels(conn, item_ids, day):
+    """item_id -> units that can still be sold today, for tracked items only."""
+    if not item_ids:
+        return {}
+    placeholders = ', '.join('?' * len(item_ids))
+    return {row['item_id']: _available(row['stock'], row['daily_limit'], row['sold']) for row in conn.execute(f'''
+        SELECT i.item_id, i.stock, i.daily_limit, COALESCE(s.sold, 0) AS sold
+        FROM inventory i LEFT JOIN daily_sales s ON s.item_id = i.item_id AND s.day = ?
+        WHERE i.item_id IN ({placeholders})
+    ''', [day, *item_ids])}
+
+
+def check_cart(conn, user_id, day):
+    """The first cart line that can't be filled, as an OutOfStock, or None.
+
+    A read-only early exit so checkouts of a sold-out item don't queue for the
+    write lock just to fail; reserve() is still what guarantees no overselling.
+    """
+    for row in conn.execute('''
+        SELECT c.item_id, c.quantity, m.name, i.stock, i.daily_limit, COALESCE(s.sold, 0) AS sold
+        FROM cart c
+        JOIN inventory i ON i.item_id = c.item_id
+        JOIN menu_items m ON m.item_id = c.item_id
+        LEFT JOIN daily_sales s ON s.item_id = c.item_id AND s.day = ?
+        WHERE c.user_id = ?
+    ''', (day, user_id)):
+        available = _available(row['stock'], row['daily_limit'], row['sold'])
+        if available is not None and available < row['quantity']:
+            return OutOfStock(row['item_id'], row['name'], available)
+    return None
+
+
+def reserve(conn, lines, day):
+    """Take ``lines`` ((item_id, quantity) pairs) out of stock. Call inside the order transaction.
+
+    Every decrement is a conditional UPDATE that only matches while enough is
+    left, so two checkouts can never both take the last unit. Raises OutOfStock
+    on the first line that can't be filled; the caller's rollback undoes the
+    lines already taken. Returns what was taken, for record_reservation().
+    """
+    tracked = {row['item_id']: row for row in conn.execute(f'''
+        SELECT item_id, stock, daily_limit FROM inventory WHERE item_id IN ({', '.join('?' * len(lines))})
+    ''', [item_id for item_id, _ in lines])}
+    taken = []
+    for item_id, quantity in sorted(lines):
+        row = tracked.get(item_id)
+        if row is None:
+            continue
+        if row['stock'] is not None and not conn.execute(
+                'UPDATE inventory SET stock = stock - ? WHERE item_id = ? AND stock >= ?',
+                (quantity, item_id, quantity)).rowcount:
+            raise _shortage(conn, item_id, day)
+        if row['daily_limit'] is not None and (quantity > row['daily_limit'] or not conn.execute('''
+                INSERT INTO daily_sales (item_id, day, sold) VALUES (?, ?, ?)
+                ON CONFLICT (item_id, day) DO UPDATE SET sold = sold + excluded.sold
+                WHERE sold + excluded.sold <= ?
+            ''', (item_id, day, quantity, row['daily_limit'])).rowcount):
+            raise _shortage(conn, item_id, day)
+        taken.append((item_id, day, quantity if row['stock'] is not None else 0,
+                      quantity if row['daily_limit'] is not None else 0))
+    return taken
+
+
+def record_reservation(conn, order_id, taken):
+    """Remember what reserve() took for ``order_id``, in the same transaction."""
+    conn.executemany('''
+        INSERT INTO order_reservations (order_id, item_id, day, stock_taken, daily_taken) VALUES (?, ?, ?, ?, ?)
+    ''', [(order_id, *line) for line in taken])
+
+
+def _shortage(conn, item_id, day):
+    name = conn.execute('SELECT name FROM menu_items WHERE item_id = ?', (item_id,)).fetchone()
+    return OutOfStock(item_id, name['name'] if name else None, levels(conn, [item_id], day).get(item_id))
+
+
+def release(conn, order_id):
+    """Give back what a cancelled order reserved. Call inside the caller's transaction.
+
+    Only units recorded at checkout go back, and the record is removed, so
+    lines bought before an item was tracked (or released already) add nothing.
+    """
+    taken = conn.execute('''
+        DELETE FROM order_reservations WHERE order_id = ? RETURNING item_id, day, stock_taken, daily_taken
+    ''', (order_id,)).fetchall()
+    conn.executemany('UPDATE inventory SET stock = stock + ? WHERE item_id = ? AND stock IS NOT NULL',
+                     [(row['stock_taken'], row['item_id']) for row in taken if row['stock_taken']])
+    conn.executemany('UPDATE daily_sales SET sold = MAX(0, sold - ?) WHERE item_id = ? AND day = ?',
+                     [(row['daily_taken'], row['item_id'], row['day']) for row in taken if row['daily_taken']])
+
+
+def consume(conn, order_id):
+    """A delivered order's stock is gone for good; forget the reservation so a later cancel can't restock it."""
+    conn.execute('DELETE FROM order_reservations WHERE order_id = ?', (order_id,))
+
+
+def edit_stock(conn, item_id, stock, daily_limit, original_stock):
+    """Apply an admin edit made against ``original_stock``. Call inside a write transaction.
+
+    Checkouts keep decrementing stock while the form is open, so an unchanged
+    stock field keeps the live count, and a changed one is only written if the
+    count is still what the admin saw. Returns False (writing nothing) when it
+    is not.
+    """
+    row = conn.execute('SELECT stock FROM inventory WHERE item_id = ?', (item_id,)).fetchone()
+    current = row['stock'] if row else None
+    if stock != original_stock and current != original_stock:
+        return False
+    set_stock(conn, item_id, stock if stock != original_stock else current, daily_limit)
+    return True
+
+
+def set_stock(conn, item_id, stock=None, daily_limit=None):
+    """Track an item (or stop tracking it when both are None). Call inside a transaction."""
+    if stock is None and daily_limit is None:
+        conn.execute('DELETE FROM inventory WHERE item_id = ?', (item_id,))
+        return
+    conn.execute('''
+        INSERT INTO inventory (item_id, stock, daily_limit) VALUES (?, ?, ?)
+        ON CONFLICT (item_id) DO UPDATE SET stock = excluded.stock, daily_limit = excluded.daily_limit
+    ''', (item_id, stock, daily_limit))
@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime
+
+from db import transaction
+
+log = logging.getLogger(__name__)
+
+# -------------------- Queue Operations --------------------
+# Jobs live in the app database (see migration 11). 'available_at' is when a
+# queued job may run, or for a running job when its visibility timeout ends and
+# another worker may take it over. Successful jobs are deleted; jobs that run
+# out of attempts stay behind with status 'dead'.
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+def enqueue(conn, name, payload=None, delay=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Add a job. Call inside the caller's transaction so it commits (or not) with the work that caused it."""
+    now = time.time()
+    return conn.execute('''
+        INSERT INTO jobs (name, payload, status, attempts, max_attempts, available_at, created_at)
+        VALUES (?, ?, 'queued', 0, ?, ?, ?)
+    ''', (name, json.dumps(payload or {}), max_attempts, now + delay,
+          datetime.now().isoformat(timespec='seconds'))).lastrowid
+
+
+def claim(conn, worker_id, visibility_timeout):
+    """Take the oldest available job, or None."""
+    now = time.time()
+    with transaction(conn):
+        return conn.execute('''
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = ?, available_at = ?
+            WHERE job_id = (
+                SELECT job_id FROM jobs
+                WHERE status IN ('queued', 'running') AND available_at <= ?
+                ORDER BY available_at LIMIT 1
+            )
+            RETURNING job_id, name, payload, attempts, max_attempts
+        ''', (worker_id, now + visibility_timeout, now)).fetchone()
+
+
+def complete(conn, job, worker_id):
+    with transaction(conn):
+        conn.execute('DELETE FROM jobs WHERE job_id = ? AND locked_by = ?', (job['job_id'], worker_id))
+
+
+def backoff_delay(attempts, base=2.0, cap=600.0):
+    """Exponential backoff with full jitter: up to base * 2**(attempts - 1), capped."""
+    return random.uniform(0, min(cap, base * 2 ** (attempts - 1)))
+
+
+def fail(conn, job, worker_id, error, retry=True, base=2.0, cap=600.0):
+    """Reschedule a failed job with backoff, or dead-letter it when out of attempts."""
+    dead = not retry or job['attempts'] >= job['max_attempts']
+    with transaction(conn):
+        conn.execute('''
+            UPDATE jobs SET status = ?, available_at = ?, locked_by = NULL, last_error = ?
+            WHERE job_id = ? AND locked_by = ?
+        ''', ('dead' if dead else 'queued', time.time() + (0 if dead else backoff_delay(job['attempts'], base, cap)),
+              error, job['job_id'], worker_id))
+    return dead
+
+
+def requeue_dead(conn, job_id=None):
+    """Give dead jobs (or one of them) a fresh set of attempts."""
+    with transaction(conn):
+        return conn.execute(f'''
+            UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, last_error = NULL
+            WHERE status = 'dead'{' AND job_id = ?' if job_id is not None else ''}
+        ''', (time.time(),) + ((job_id,) if job_id is not None else ())).rowcount
+
+
+def queue_stats(conn):
+    counts = dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+    oldest = conn.execute('''
+        SELECT MIN(available_at) FROM jobs WHERE status IN ('queued', 'running')
+    ''').fetchone()[0]
+    return {'queued': counts.get('queued', 0), 'running': counts.get('running', 0), 'dead': counts.get('dead', 0),
+            'oldest_wait_seconds': round(max(0.0, time.time() - oldest), 3) if oldest else 0.0}
+
+
+# -------------------- Worker --------------------
+class PermanentJobError(Exception):
+    """Raise from a handler to dead-letter the job without further retries."""
+
+
+class Worker:
+    """Runs registered handlers for queued jobs on a few daemon threads.
+
+    Handlers are called as ``handler(conn, payload)`` and must be idempotent:
+    a job whose worker dies mid-run is picked up again after the visibility
+    timeout. Like the connection pool, the worker restarts its threads in a
+    forked child instead of assuming the parent's are alive.
+    """
+
+    def __init__(self, pool_getter, threads=1, poll_interval=1.0, visibility_timeout=60.0,
+                 backoff_base=2.0, backoff_cap=600.0):
+        self.pool_getter = pool_getter
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.handlers = {}
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._running = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def handler(self, name):
+        def register(fn):
+            self.handlers[name] = fn
+            return fn
+        return register
+
+    def ensure_started(self):
+        if self.threads <= 0 or (self._pid == os.getpid() and self._running):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._running:
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._running = [threading.Thread(target=self._loop, name=f'job-worker-{i}', daemon=True)
+                             for i in range(self.threads)]
+            for thread in self._running:
+                thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.wake(all_threads=True)
+        for thread in self._running:
+            thread.join(timeout)
+        self._running = []
+
+    def wake(self, all_threads=False):
+        """Skip the poll wait after enqueueing in this process."""
+        with self._wakeup:
+            if all_threads:
+                self._wakeup.notify_all()
+            else:
+                self._wakeup.notify()
+
+    def _loop(self):
+        worker_id = f'{os.getpid()}-{threading.current_thread().name}-{uuid.uuid4().hex[:6]}'
+        while not self._stopping.is_set():
+            try:
+                ran = self.run_once(worker_id)
+            except Exception:
+                log.exception('Job worker %s failed to poll the queue', worker_id)
+                ran = False
+            if not ran:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+
+    def run_once(self, worker_id=None):
+        """Claim and run one job. Returns False when nothing was available."""
+        worker_id = worker_id or f'{os.getpid()}-once'
+        pool = self.pool_getter()
+        conn = pool.acquire()
+        try:
+            job = claim(conn, worker_id, self.visibility_timeout)
+            if job is None:
+                return False
+            handler = self.handlers.get(job['name'])
+            try:
+                if job['attempts'] > job['max_attempts']:
+                    # Reclaimed after its visibility timeout once too often (e.g. it keeps killing workers)
+                    raise PermanentJobError(f'abandoned by workers {job["attempts"] - 1} times')
+                if handler is None:
+                    raise PermanentJobError(f'no handler registered for {job["name"]!r}')
+                handler(conn, json.loads(job['payload']))
+            except Exception as exc:
+                if conn.in_transaction:
+                    conn.rollback()
+                permanent = isinstance(exc, PermanentJobError)
+                error = str(exc) if permanent else traceback.format_exc(limit=5)
+                dead = fail(conn, job, worker_id, error, retry=not permanent,
+                            base=self.backoff_base, cap=self.backoff_cap)
+                log.warning('Job %s (%s) attempt %s failed%s: %s', job['job_id'], job['name'], job['attempts'],
+                            ', dead-lettered' if dead else '', exc)
+            else:
+                complete(conn, job, worker_id)
+            return True
+        finally:
+            pool.release(conn)
+
+    def drain(self, limit=None):
+        """Run available jobs on the calling thread until none are left (CLI / tests)."""
+        count = 0
+        while (limit is None or count < limit) and self.run_once():
+            count += 1
+        return count
@@ -0,0 +1,673 @@
+import ast
+import sqlite3
+from collections import defaultdict
+from datetime import datetime
+
+# -------------------- Migration Registry --------------------
+# Each step runs once, in version order, inside its own write transaction.
+# Append new steps at the end; never renumber or edit a released step.
+MIGRATIONS = []
+
+def migration(version):
+    def register(fn):
+        assert not MIGRATIONS or version > MIGRATIONS[-1][0], 'migrations must be added in order'
+        MIGRATIONS.append((version, fn))
+        return fn
+    return register
+
+def current_version(conn):
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def apply_migrations(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )
+    ''')
+    conn.commit()
+
+    applied = []
+    for version, fn in MIGRATIONS:
+        # Re-check under the write lock so concurrent workers don't apply a step twice
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            fn(conn)
+            conn.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                         (version, (fn.__doc__ or fn.__name__).strip(), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+# -------------------- Migrations --------------------
+@migration(1)
+def add_hot_path_indexes(conn):
+    """Secondary indexes for cart, order, review, user and category lookups"""
+    # Merge duplicate cart lines before the unique index can be built
+    conn.execute('''
+        UPDATE cart SET quantity = (
+            SELECT SUM(c2.quantity) FROM cart c2
+            WHERE c2.user_id = cart.user_id AND c2.item_id = cart.item_id
+        )
+        WHERE cart_id IN (
+            SELECT MIN(cart_id) FROM cart GROUP BY user_id, item_id HAVING COUNT(*) > 1
+        )
+    ''')
+    conn.execute('''
+        DELETE FROM cart WHERE cart_id NOT IN (
+            SELECT MIN(cart_id) FROM cart GROUP BY user_id, item_id
+        )
+    ''')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_user_item ON cart (user_id, item_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_order_details_order ON order_details (order_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_reviews_item ON reviews (item_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_date ON orders (user_id, order_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_role_email ON users (role, email)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_categories_name ON categories (name)')
+
+@migration(2)
+def add_password_fingerprint(conn):
+    """Indexed HMAC fingerprint of each user's password for the reuse check"""
+    conn.execute('ALTER TABLE users ADD COLUMN password_fingerprint TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_password_fp ON users (password_fingerprint)')
+
+@migration(3)
+def add_menu_filter_indexes(conn):
+    """Indexes for filtering the dashboard grid by category and restaurant"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_menu_items_category ON menu_items (category_id, item_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_menu_items_restaurant ON menu_items (restaurant_id, item_id)')
+
+@migration(4)
+def add_order_idempotency(conn):
+    """Idempotency keys on orders and unit price snapshots on order details"""
+    conn.execute('ALTER TABLE orders ADD COLUMN idempotency_key TEXT')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency ON orders (user_id, idempotency_key)')
+    conn.execute('ALTER TABLE order_details ADD COLUMN unit_price REAL')
+    conn.execute('UPDATE order_details SET unit_price = subtotal * 1.0 / quantity WHERE quantity > 0')
+
+@migration(5)
+def add_stats_counters(conn):
+    """Trigger-maintained counters for the admin overview"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stats (
+            name TEXT PRIMARY KEY,
+            value REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO stats (name, value)
+        SELECT 'total_orders', COUNT(*) FROM orders
+        UNION ALL SELECT 'total_sales', COALESCE(SUM(total_amount), 0) FROM orders
+        UNION ALL SELECT 'total_products', COUNT(*) FROM menu_items
+        UNION ALL SELECT 'total_customers', COUNT(*) FROM users WHERE role = 'customer'
+    ''')
+    # One execute() per trigger: executescript() would commit the migration's transaction
+    for trigger in STATS_TRIGGERS:
+        conn.execute(trigger)
+
+@migration(6)
+def add_sales_rollups(conn):
+    """Hourly and daily sales buckets per restaurant and per item"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS restaurant_sales_rollup (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            restaurant_id INTEGER NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            items_sold INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket, restaurant_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS item_sales_rollup (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket, item_id)
+        ) WITHOUT ROWID
+    ''')
+
+@migration(7)
+def add_menu_search_index(conn):
+    """FTS5 index over menu item, category and restaurant names"""
+    # rowid mirrors menu_items.item_id; prefix indexes make type-ahead queries cheap
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS menu_search USING fts5(
+            name, description, category, restaurant,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+    # Name matches outrank category/restaurant matches, which outrank description
+    conn.execute("INSERT INTO menu_search (menu_search, rank) VALUES ('rank', 'bm25(10.0, 1.0, 3.0, 3.0)')")
+    conn.execute('''
+        INSERT INTO menu_search (rowid, name, description, category, restaurant)
+        SELECT m.item_id, m.name, m.description, c.name, r.name
+        FROM menu_items m
+        LEFT JOIN categories c ON c.category_id = m.category_id
+        LEFT JOIN restaurants r ON r.restaurant_id = m.restaurant_id
+    ''')
+    for trigger in MENU_SEARCH_TRIGGERS:
+        conn.execute(trigger)
+
+REVIEW_STATS_BACKFILL = '''
+    INSERT OR REPLACE INTO review_stats
+        (item_id, rating_count, rating_sum, stars_1, stars_2, stars_3, stars_4, stars_5)
+    SELECT item_id, COUNT(*), SUM(rating),
+           SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5)
+    FROM reviews
+    WHERE item_id IS NOT NULL
+    GROUP BY item_id
+'''
+
+@migration(8)
+def add_review_stats(conn):
+    """Per-item rating count, sum and histogram; newest-first review index"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS review_stats (
+            item_id INTEGER PRIMARY KEY,
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            stars_1 INTEGER NOT NULL DEFAULT 0,
+            stars_2 INTEGER NOT NULL DEFAULT 0,
+            stars_3 INTEGER NOT NULL DEFAULT 0,
+            stars_4 INTEGER NOT NULL DEFAULT 0,
+            stars_5 INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute(REVIEW_STATS_BACKFILL)
+    # (item_id, date) with the implicit review_id suffix serves the newest-first keyset
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_reviews_item_date ON reviews (item_id, date)')
+    conn.execute('DROP INDEX IF EXISTS idx_reviews_item')
+
+@migration(9)
+def add_catalog_version(conn):
+    """Global catalog version bumped by any menu, category or restaurant write"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 1)')
+    for table in ('menu_items', 'categories', 'restaurants'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_catalog_version_{table}_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+
+@migration(10)
+def add_upload_refs(conn):
+    """Reference counts for content-addressed uploads"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS uploads (
+            filename TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_uploads_unreferenced ON uploads(created_at) WHERE ref_count = 0')
+    for trigger in UPLOAD_REF_TRIGGERS:
+        conn.execute(trigger)
+
+@migration(11)
+def add_job_queue(conn):
+    """Durable background job queue; notifications index"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            available_at REAL NOT NULL,
+            locked_by TEXT,
+            last_error TEXT,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_available ON jobs (available_at)
+        WHERE status IN ('queued', 'running')
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dead ON jobs (job_id) WHERE status = 'dead'")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications (user_id, notification_id)')
+
+@migration(12)
+def add_notification_counts(conn):
+    """Read state, broadcast ids and per-user unread counters for notifications"""
+    conn.execute('ALTER TABLE notifications ADD COLUMN read_at TEXT')
+    conn.execute('ALTER TABLE notifications ADD COLUMN broadcast_id TEXT')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_notifications_broadcast ON notifications (broadcast_id, user_id)
+        WHERE broadcast_id IS NOT NULL
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notification_counts (
+            user_id INTEGER PRIMARY KEY,
+            unread INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO notification_counts (user_id, unread)
+        SELECT user_id, COUNT(*) FROM notifications WHERE user_id IS NOT NULL GROUP BY user_id
+    ''')
+    for trigger in NOTIFICATION_COUNT_TRIGGERS:
+        conn.execute(trigger)
+
+@migration(13)
+def add_drivers(conn):
+    """Drivers and dispatch state for deliveries"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS drivers (
+            driver_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            latitude REAL,
+            longitude REAL,
+            status TEXT NOT NULL DEFAULT 'available',
+            delivery_id INTEGER,
+            updated_at TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_drivers_available ON drivers (driver_id) WHERE status = 'available'")
+    conn.execute('ALTER TABLE delivery ADD COLUMN driver_id INTEGER REFERENCES drivers(driver_id)')
+    conn.execute('ALTER TABLE delivery ADD COLUMN assigned_at TEXT')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_delivery_awaiting ON delivery (delivery_id)
+        WHERE delivery_status = 'Awaiting driver'
+    ''')
+
+@migration(14)
+def add_inventory(conn):
+    """Per-item stock and daily limits"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS inventory (
+            item_id INTEGER PRIMARY KEY REFERENCES menu_items(item_id),
+            stock INTEGER,
+            daily_limit INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_sales (
+            item_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            sold INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (item_id, day)
+        ) WITHOUT ROWID
+    ''')
+
+@migration(15)
+def add_order_reservations(conn):
+    """Stock each order reserved, so cancelling gives back exactly that"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS order_reservations (
+            order_id INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            stock_taken INTEGER NOT NULL DEFAULT 0,
+            daily_taken INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (order_id, item_id)
+        ) WITHOUT ROWID
+    ''')
+
+MENU_SEARCH_TRIGGERS = [
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_menu_search_insert AFTER INSERT ON menu_items BEGIN
+            INSERT INTO menu_search (rowid, name, description, category, restaurant)
+            VALUES (NEW.item_id, NEW.name, NEW.description,
+                    (SELECT name FROM categories WHERE category_id = NEW.category_id),
+                    (SELECT name FROM restaurants WHERE restaurant_id = NEW.restaurant_id));
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_menu_search_update
+        AFTER UPDATE OF name, description, category_id, restaurant_id ON menu_items BEGIN
+            DELETE FROM menu_search WHERE rowid = OLD.item_id;
+            INSERT INTO menu_search (rowid, name, description, category, restaurant)
+            VALUES (NEW.item_id, NEW.name, NEW.description,
+                    (SELECT name FROM categories WHERE category_id = NEW.category_id),
+                    (SELECT name FROM restaurants WHERE restaurant_id = NEW.restaurant_id));
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_menu_search_delete AFTER DELETE ON menu_items BEGIN
+            DELETE FROM menu_search WHERE rowid = OLD.item_id;
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_menu_search_category AFTER UPDATE OF name ON categories BEGIN
+            UPDATE menu_search SET category = NEW.name
+            WHERE rowid IN (SELECT item_id FROM menu_items WHERE category_id = NEW.category_id);
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_menu_search_restaurant AFTER UPDATE OF name ON restaurants BEGIN
+            UPDATE menu_search SET restaurant = NEW.name
+            WHERE rowid IN (SELECT item_id FROM menu_items WHERE restaurant_id = NEW.restaurant_id);
+        END
+    ''',
+]
+
+# Unread counts per user, so badges never need COUNT(*) over a user's history.
+NOTIFICATION_COUNT_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_notification_counts_insert
+    AFTER INSERT ON notifications WHEN new.user_id IS NOT NULL AND new.read_at IS NULL BEGIN
+        INSERT INTO notification_counts (user_id, unread) VALUES (new.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET unread = unread + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_notification_counts_read
+    AFTER UPDATE OF read_at ON notifications
+    WHEN new.user_id IS NOT NULL AND old.read_at IS NULL AND new.read_at IS NOT NULL BEGIN
+        UPDATE notification_counts SET unread = unread - 1 WHERE user_id = new.user_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_notification_counts_unread
+    AFTER UPDATE OF read_at ON notifications
+    WHEN new.user_id IS NOT NULL AND old.read_at IS NOT NULL AND new.read_at IS NULL BEGIN
+        INSERT INTO notification_counts (user_id, unread) VALUES (new.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET unread = unread + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_notification_counts_delete
+    AFTER DELETE ON notifications WHEN old.user_id IS NOT NULL AND old.read_at IS NULL BEGIN
+        UPDATE notification_counts SET unread = unread - 1 WHERE user_id = old.user_id;
+    END
+    ''',
+]
+
+# Only files registered in uploads are counted (and ever garbage collected);
+# legacy names such as the default profile image are left alone.
+UPLOAD_REF_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_uploads_{table}_insert
+    AFTER INSERT ON {table} WHEN new.{column} IS NOT NULL BEGIN
+        UPDATE uploads SET ref_count = ref_count + 1 WHERE filename = new.{column};
+    END
+    ''' for table, column in (('menu_items', 'image'), ('users', 'profile_image'))
+] + [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_uploads_{table}_update
+    AFTER UPDATE OF {column} ON {table} WHEN old.{column} IS NOT new.{column} BEGIN
+        UPDATE uploads SET ref_count = ref_count - 1 WHERE filename = old.{column};
+        UPDATE uploads SET ref_count = ref_count + 1 WHERE filename = new.{column};
+    END
+    ''' for table, column in (('menu_items', 'image'), ('users', 'profile_image'))
+] + [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_uploads_{table}_delete
+    AFTER DELETE ON {table} WHEN old.{column} IS NOT NULL BEGIN
+        UPDATE uploads SET ref_count = ref_count - 1 WHERE filename = old.{column};
+    END
+    ''' for table, column in (('menu_items', 'image'), ('users', 'profile_image'))
+]
+
+STATS_TRIGGERS = [
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_orders_insert AFTER INSERT ON orders BEGIN
+            UPDATE stats SET value = value + 1 WHERE name = 'total_orders';
+            UPDATE stats SET value = value + COALESCE(NEW.total_amount, 0) WHERE name = 'total_sales';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_orders_delete AFTER DELETE ON orders BEGIN
+            UPDATE stats SET value = value - 1 WHERE name = 'total_orders';
+            UPDATE stats SET value = value - COALESCE(OLD.total_amount, 0) WHERE name = 'total_sales';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_orders_update AFTER UPDATE OF total_amount ON orders BEGIN
+            UPDATE stats SET value = value - COALESCE(OLD.total_amount, 0) + COALESCE(NEW.total_amount, 0)
+            WHERE name = 'total_sales';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_menu_items_insert AFTER INSERT ON menu_items BEGIN
+            UPDATE stats SET value = value + 1 WHERE name = 'total_products';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_menu_items_delete AFTER DELETE ON menu_items BEGIN
+            UPDATE stats SET value = value - 1 WHERE name = 'total_products';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_insert AFTER INSERT ON users
+        WHEN NEW.role = 'customer' BEGIN
+            UPDATE stats SET value = value + 1 WHERE name = 'total_customers';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_delete AFTER DELETE ON users
+        WHEN OLD.role = 'customer' BEGIN
+            UPDATE stats SET value = value - 1 WHERE name = 'total_customers';
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_role AFTER UPDATE OF role ON users
+        WHEN (OLD.role IS 'customer') != (NEW.role IS 'customer') BEGIN
+            UPDATE stats SET value = value + (CASE WHEN NEW.role IS 'customer' THEN 1 ELSE -1 END)
+            WHERE name = 'total_customers';
+        END
+    ''',
+]
+
+# -------------------- Query Plan Check --------------------
+# SQL assembled at runtime (f-strings, concatenation, optional clauses) is
+# expanded statically into every text it can take, and each one is planned. A
+# call site whose SQL can't be derived that way is reported as unchecked.
+SQL_VERBS = ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')
+MAX_QUERY_VARIANTS = 256
+
+class Unresolved(Exception):
+    pass
+
+def _unique(variants):
+    variants = list(dict.fromkeys(variants))
+    if len(variants) > MAX_QUERY_VARIANTS:
+        raise Unresolved(f'more than {MAX_QUERY_VARIANTS} variants')
+    return variants
+
+def _concat(options):
+    variants = ['']
+    for choices in options:
+        variants = _unique(v + c for v in variants for c in choices)
+    return variants
+
+def _own_nodes(scope):
+    """Nodes of a module, function or lambda body in source order, not entering nested functions."""
+    nodes, stack = [], list(scope.body) if isinstance(scope.body, list) else [scope.body]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(child for child in ast.iter_child_nodes(node)
+                     if not isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)))
+    return sorted(nodes, key=lambda node: (getattr(node, 'lineno', 0), getattr(node, 'col_offset', 0)))
+
+def _strings(node, scopes):
+    """Every string ``node`` can evaluate to; raises Unresolved if that isn't knowable statically."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for part in node.values:
+            if isinstance(part, ast.Constant):
+                parts.append([part.value])
+            elif part.format_spec is None and part.conversion in (-1, ord('s')):
+                parts.append(_strings(part.value, scopes))
+            else:
+                raise Unresolved(ast.unparse(part))
+        return _concat(parts)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        return _concat([_strings(node.left, scopes), _strings(node.right, scopes)])
+    if isinstance(node, ast.IfExp):
+        return _unique(_strings(node.body, scopes) + _strings(node.orelse, scopes))
+    if isinstance(node, ast.Name):
+        return _resolve(node.id, scopes, _strings)
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'join'
+            and isinstance(node.func.value, ast.Constant) and len(node.args) == 1):
+        separator, items = node.func.value.value, node.args[0]
+        if (isinstance(items, ast.BinOp) and isinstance(items.op, ast.Mult)
+                and isinstance(items.left, ast.Constant) and items.left.value == '?'):
+            return [separator.join(['?', '?'])]  # an IN list of placeholders; two stand for any length
+        return _unique(separator.join(variant) for variant in _lists(items, scopes))
+    raise Unresolved(ast.unparse(node))
+
+def _lists(node, scopes):
+    """Every list of strings ``node`` can evaluate to, as tuples."""
+    if isinstance(node, (ast.List, ast.Tuple)):
+        variants = [()]
+        for element in node.elts:
+            variants = _unique(v + (s,) for v in variants for s in _strings(element, scopes))
+        return variants
+    if isinstance(node, ast.Name):
+        return _resolve(node.id, scopes, _lists)
+    raise Unresolved(ast.unparse(node))
+
+def _loop_values(loop, name, scopes):
+    """Values ``name`` takes as the target of ``for ... in MAPPING.items()`` / ``.values()`` over a dict literal."""
+    it, target = loop.iter, loop.target
+    if (isinstance(it, ast.Call) and isinstance(it.func, ast.Attribute) and isinstance(it.func.value, ast.Name)
+            and not it.args):
+        if (it.func.attr == 'items' and isinstance(target, ast.Tuple) and len(target.elts) == 2
+                and isinstance(target.elts[1], ast.Name) and target.elts[1].id == name):
+            mapping = _dict_literal(it.func.value.id, scopes)
+        elif it.func.attr == 'values' and isinstance(target, ast.Name):
+            mapping = _dict_literal(it.func.value.id, scopes)
+        else:
+            mapping = None
+        if mapping is not None:
+            return _unique(s for value in mapping.values for s in _strings(value, scopes))
+    raise Unresolved(f'loop variable {name}')
+
+def _dict_literal(name, scopes):
+    for scope in scopes:
+        for node in _own_nodes(scope):
+            if (isinstance(node, ast.Assign) and isinstance(node.value, ast.Dict)
+                    and any(isinstance(t, ast.Name) and t.id == name for t in node.targets)):
+                return node.value
+    return None
+
+def _resolve(name, scopes, evaluate):
+    """Every value ``name`` can hold, from all its bindings in the nearest scope that binds it.
+
+    Each assignment is one alternative; ``+=`` and ``.append()`` are taken as
+    optional, since they usually sit under an ``if``.
+    """
+    for depth, scope in enumerate(scopes):
+        outer = scopes[depth:]
+        if not isinstance(scope, ast.Module) and any(
+                arg.arg == name for arg in ast.walk(scope.args) if isinstance(arg, ast.arg)):
+            raise Unresolved(f'parameter {name}')
+        variants, handled = [], set()
+        for node in _own_nodes(scope):
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name) and target.id == name:
+                        variants = _unique(variants + evaluate(node.value, outer))
+                        handled.add(target)
+                    elif isinstance(target, ast.Tuple) and isinstance(node.value, ast.Tuple):
+                        for element, value in zip(target.elts, node.value.elts):
+                            if isinstance(element, ast.Name) and element.id == name:
+                                variants = _unique(variants + evaluate(value, outer))
+                                handled.add(element)
+            elif (isinstance(node, ast.AugAssign) and isinstance(node.op, ast.Add)
+                    and isinstance(node.target, ast.Name) and node.target.id == name):
+                variants = _unique(variants + [v + a for v in variants for a in evaluate(node.value, outer)])
+                handled.add(node.target)
+            elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'append'
+                    and isinstance(node.func.value, ast.Name) and node.func.value.id == name
+                    and evaluate is _lists and len(node.args) == 1):
+                variants = _unique(variants + [v + (s,) for v in variants for s in _strings(node.args[0], outer)])
+            elif isinstance(node, ast.For):
+                for element in ast.walk(node.target):
+                    if isinstance(element, ast.Name) and element.id == name:
+                        variants = _unique(variants + _loop_values(node, name, outer))
+                        handled.add(element)
+        stores = [node for node in _own_nodes(scope)
+                  if isinstance(node, ast.Name) and node.id == name and isinstance(node.ctx, ast.Store)]
+        if any(node not in handled for node in stores):
+            raise Unresolved(f'{name} is bound in a way that cannot be followed')
+        if stores:
+            return variants
+    raise Unresolved(f'{name} is not defined in this module')
+
+def collect_queries(path):
+    """Return (lineno, variants) for every SQL statement passed to .execute() in a module.
+
+    ``variants`` lists each text the statement can take, whitespace-normalised,
+    or is None when it is built in a way that can't be followed statically.
+    """
+    tree = ast.parse(open(path, encoding='utf-8').read(), filename=path)
+    queries = []
+
+    def visit(node, scopes):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+                visit(child, [child] + scopes)
+                continue
+            if (isinstance(child, ast.Call) and isinstance(child.func, ast.Attribute)
+                    and child.func.attr in ('execute', 'executemany') and child.args):
+                try:
+                    variants = [' '.join(sql.split()) for sql in _strings(child.args[0], scopes)]
+                except (Unresolved, RecursionError):
+                    queries.append((child.lineno, None))
+                else:
+                    variants = [sql for sql in variants if sql.split(' ', 1)[0].upper() in SQL_VERBS]
+                    if variants:
+                        queries.append((child.lineno, variants))
+            visit(child, scopes)
+
+    visit(tree, [tree])
+    return sorted(queries, key=lambda query: query[0])
+
+def full_scans(conn, sql):
+    """Return the tables a filtered query reads with a full scan instead of an index."""
+    if ' WHERE ' not in f' {sql.upper()} ':
+        return []  # unfiltered listings scan on purpose
+    params = [None] * sql.count('?') if '?' in sql else defaultdict(lambda: None)  # :named parameters
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    # Subquery results are scanned by name too, but they are already filtered
+    subqueries = {row[3].split(' ', 1)[1] for row in plan if row[3].startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+    scans = []
+    for row in plan:
+        detail = row[3]
+        if (detail.startswith('SCAN ') and ' USING ' not in detail and ' VIRTUAL TABLE INDEX ' not in detail
+                and detail[5:] not in subqueries):
+            scans.append(detail)
+    return scans
+
+def unindexed_queries(conn, path):
+    """(lineno, sql, problems) for each query variant that scans, or whose SQL is unchecked (sql None)."""
+    problems = []
+    for lineno, variants in collect_queries(path):
+        if variants is None:
+            problems.append((lineno, None, ['unchecked: SQL is built at runtime in a way the check cannot expand']))
+            continue
+        for sql in variants:
+            try:
+                scans = full_scans(conn, sql)
+            except sqlite3.Error as exc:
+                scans = [f'cannot plan: {exc}']
+            if scans:
+                problems.append((lineno, sql, scans))
+    return problems
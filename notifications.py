@@ -0,0 +1,162 @@
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+
+from db import transaction
+
+log = logging.getLogger(__name__)
+
+INSERT_NOTIFICATION = 'INSERT INTO notifications (user_id, message, timestamp) VALUES (?, ?, ?)'
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+# -------------------- Buffered Writes --------------------
+class NotificationBuffer:
+    """Collects notifications in memory and writes them in batches.
+
+    A flusher thread writes whatever is pending every ``flush_interval``
+    seconds, or as soon as ``batch_size`` messages are waiting, with one
+    executemany per batch instead of one write transaction per message.
+    Pending messages live only in this process: a crash loses at most one
+    interval's worth, so anything that must not be lost belongs in a job.
+    """
+
+    def __init__(self, pool_getter, batch_size=500, flush_interval=1.0, max_pending=50000):
+        self.pool_getter = pool_getter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.flushed = 0
+        self.dropped = 0
+        self._pending = []
+        self._ready = threading.Condition()
+        self._flushing = threading.Lock()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    def add(self, user_id, message):
+        with self._ready:
+            if len(self._pending) >= self.max_pending:
+                # The database has been unwritable for a while; keep the newest
+                self._pending.pop(0)
+                self.dropped += 1
+            self._pending.append((user_id, message, _now()))
+            if len(self._pending) >= self.batch_size:
+                self._ready.notify()
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._ready:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='notification-flusher', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._ready:
+                if len(self._pending) < self.batch_size:
+                    self._ready.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                log.exception('Failed to flush notifications; will retry')
+
+    def flush(self):
+        """Write everything pending now. Returns the number of notifications written."""
+        with self._flushing:
+            with self._ready:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            written, pool, conn = 0, None, None
+            try:
+                pool = self.pool_getter()
+                conn = pool.acquire()
+                while written < len(batch):
+                    chunk = batch[written:written + self.batch_size]
+                    with transaction(conn):
+                        conn.executemany(INSERT_NOTIFICATION, chunk)
+                    written += len(chunk)
+                    self.flushed += len(chunk)
+            except BaseException:
+                # Put back whatever wasn't written, still within the max_pending cap
+                with self._ready:
+                    self._pending[:0] = batch[written:]
+                    overflow = len(self._pending) - self.max_pending
+                    if overflow > 0:
+                        del self._pending[:overflow]
+                        self.dropped += overflow
+                raise
+            finally:
+                if conn is not None:
+                    pool.release(conn)
+            return len(batch)
+
+    def stats(self):
+        with self._ready:
+            pending = len(self._pending)
+        return {'pending': pending, 'flushed': self.flushed, 'dropped': self.dropped,
+                'batch_size': self.batch_size, 'flush_interval': self.flush_interval}
+
+
+# -------------------- Broadcast --------------------
+def broadcast(conn, message, broadcast_id, role='customer', chunk_size=1000):
+    """Notify every user with ``role``, walking user ids in chunks.
+
+    Each chunk is its own short write transaction, so requests keep getting the
+    writer lock in between. Rows carry ``broadcast_id`` and a unique index makes
+    re-running the same broadcast (e.g. a retried job) resume where it stopped
+    instead of notifying anyone twice.
+    """
+    last_id = conn.execute('SELECT MAX(user_id) FROM notifications WHERE broadcast_id = ?',
+                           (broadcast_id,)).fetchone()[0] or 0
+    sent = 0
+    while True:
+        ids = [row[0] for row in conn.execute(
+            'SELECT user_id FROM users WHERE role = ? AND user_id > ? ORDER BY user_id LIMIT ?',
+            (role, last_id, chunk_size))]
+        if not ids:
+            return sent
+        timestamp = _now()
+        with transaction(conn):
+            conn.executemany('''
+                INSERT OR IGNORE INTO notifications (user_id, message, timestamp, broadcast_id)
+                VALUES (?, ?, ?, ?)
+            ''', [(user_id, message, timestamp, broadcast_id) for user_id in ids])
+        sent += len(ids)
+        last_id = ids[-1]
+
+
+# -------------------- Reading --------------------
+def unread_count(conn, user_id):
+    """Served from notification_counts, kept current by triggers (see migration 12)."""
+    row = conn.execute('SELECT unread FROM notification_counts WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def recent(conn, user_id, limit=20, before_id=None):
+    """Newest notifications first; ``before_id`` is the last id of the previous page."""
+    return conn.execute(f'''
+        SELECT notification_id, message, timestamp, read_at FROM notifications
+        WHERE user_id = ?{' AND notification_id < ?' if before_id is not None else ''}
+        ORDER BY notification_id DESC LIMIT ?
+    ''', (user_id,) + ((before_id,) if before_id is not None else ()) + (limit,)).fetchall()
+
+
+def mark_read(conn, user_id, up_to=None):
+    """Mark the user's unread notifications (up to id ``up_to``) read."""
+    with transaction(conn):
+        return conn.execute(f'''
+            UPDATE notifications SET read_at = ?
+            WHERE user_id = ? AND read_at IS NULL{' AND notification_id <= ?' if up_to is not None else ''}
+        ''', (_now(), user_id) + ((up_to,) if up_to is not None else ())).rowcount
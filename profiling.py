@@ -0,0 +1,62 @@
+import re
+import sqlite3
+import sys
+from collections import Counter
+
+import db
+
+# -------------------- Statement Normalization --------------------
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+def normalize(sql):
+    """Collapse a statement to its shape: literals become ?, IN lists (?, ...)."""
+    sql = _STRING.sub('?', ' '.join(sql.split()))
+    sql = _NUMBER.sub('?', sql)
+    return _IN_LIST.sub('(?, ...)', sql)
+
+
+# -------------------- Call Sites --------------------
+_INTERNAL_FILES = {__file__, db.__file__}
+
+
+def call_site(depth=1):
+    """file:line in function of the first caller outside the DB layer."""
+    frame = sys._getframe(depth + 1)
+    while frame is not None and frame.f_code.co_filename in _INTERNAL_FILES:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    return f'{frame.f_code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno} in {frame.f_code.co_name}'
+
+
+def explain(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN for a statement, one detail line per plan row."""
+    try:
+        # The base class execute bypasses TimedConnection, so the plan itself isn't recorded
+        rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    except (sqlite3.Error, ValueError):
+        return []
+    return [row[3] for row in rows]
+
+
+# -------------------- N+1 Detection --------------------
+class NPlusOneError(AssertionError):
+    """Raised (when enabled) for a request that repeats one statement too often."""
+
+
+def repeated_statements(statements, threshold):
+    """[(normalized sql, count, call sites)] for shapes run more than ``threshold`` times.
+
+    ``statements`` is an iterable of (sql, call site) pairs.
+    """
+    counts = Counter()
+    sites = {}
+    for sql, site in statements:
+        shape = normalize(sql)
+        counts[shape] += 1
+        sites.setdefault(shape, Counter())[site] += 1
+    return [(shape, count, [site for site, _ in sites[shape].most_common()])
+            for shape, count in counts.most_common() if count > threshold]
@@ -0,0 +1,184 @@
+import random
+from datetime import datetime, timedelta
+
+from db import transaction
+from dispatch import PLACES
+from migrations import REVIEW_STATS_BACKFILL
+
+# -------------------- Volumes --------------------
+# Row counts per preset; any of them can be overridden individually.
+SCALES = {
+    'small': {'restaurants': 50, 'categories': 20, 'menu_items': 5000, 'users': 5000,
+              'order_details': 50000, 'reviews': 20000, 'cart': 5000, 'drivers': 200},
+    'medium': {'restaurants': 1000, 'categories': 50, 'menu_items': 100000, 'users': 100000,
+               'order_details': 1000000, 'reviews': 200000, 'cart': 50000, 'drivers': 2000},
+    'large': {'restaurants': 10000, 'categories': 100, 'menu_items': 1000000, 'users': 1000000,
+              'order_details': 10000000, 'reviews': 2000000, 'cart': 500000, 'drivers': 10000},
+}
+SEED_PASSWORD = 'Seed-pass-1'  # every generated user logs in with this
+SHIPPING_COST = 50
+ORDER_STATUSES = ('Pending', 'Preparing', 'Delivered')
+WORDS = ('adobo', 'sinigang', 'lechon', 'pancit', 'lumpia', 'sisig', 'kare-kare', 'bulalo', 'tapa', 'longganisa',
+         'halo-halo', 'bibingka', 'ensaymada', 'siopao', 'turon', 'mami', 'chicken', 'pork', 'beef', 'garlic',
+         'rice', 'spicy', 'sweet', 'crispy', 'grilled', 'coke', 'mango', 'ube', 'coconut', 'special')
+CITIES = ('Manila', 'Quezon City', 'Makati', 'Pasig', 'Taguig', 'Cebu', 'Davao', 'Iloilo', 'Baguio', 'Bacolod')
+
+
+def _phrase(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def _near(rng, city, spread=0.05):
+    """A point within about ``spread`` degrees (~5 km) of ``city``."""
+    lat, lng = PLACES[city.lower()]
+    return round(lat + rng.uniform(-spread, spread), 5), round(lng + rng.uniform(-spread, spread), 5)
+
+
+def _next_id(conn, table, column):
+    return conn.execute(f'SELECT COALESCE(MAX({column}), 0) + 1 FROM {table}').fetchone()[0]
+
+
+def _insert_batches(conn, sql, rows, batch_size):
+    """executemany ``rows`` (any iterable) in one short write transaction per batch."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            with transaction(conn):
+                conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        with transaction(conn):
+            conn.executemany(sql, batch)
+
+
+def generate(conn, volumes, password_hash, password_fingerprint=None, seed=42, days=365,
+             end=None, batch_size=10000, progress=print):
+    """Append synthetic rows to every table created by init_db().
+
+    The same ``seed``, ``volumes`` and ``end`` date produce the same data. Rows
+    are appended after existing ids, so seeding a copy of a real database works.
+    Derived tables kept by triggers (stats, menu search, catalog version) update
+    as rows go in; review_stats is rebuilt at the end. Sales rollups are left to
+    the caller.
+    """
+    rng = random.Random(seed)
+    geo = random.Random(f'{seed}-geo')  # coordinates draw from their own stream
+    end = end or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    span = int((end - start).total_seconds())
+
+    def timestamp():
+        return (start + timedelta(seconds=rng.randrange(span))).strftime('%Y-%m-%d %H:%M:%S')
+
+    first_restaurant = _next_id(conn, 'restaurants', 'restaurant_id')
+    restaurant_ids = range(first_restaurant, first_restaurant + volumes['restaurants'])
+    _insert_batches(conn, 'INSERT INTO restaurants (restaurant_id, name, location, contact) VALUES (?, ?, ?, ?)', (
+        (rid, f'{_phrase(rng, 2).title()} #{rid}', '{} ({}, {})'.format(city, *_near(geo, city)),
+         f'09{rng.randrange(10 ** 9):09d}')
+        for rid, city in ((rid, rng.choice(CITIES)) for rid in restaurant_ids)
+    ), batch_size)
+    progress(f'restaurants: {len(restaurant_ids)}')
+
+    first_category = _next_id(conn, 'categories', 'category_id')
+    category_ids = range(first_category, first_category + volumes['categories'])
+    _insert_batches(conn, 'INSERT INTO categories (category_id, name) VALUES (?, ?)', (
+        (cid, f'{rng.choice(WORDS).title()} {cid}') for cid in category_ids
+    ), batch_size)
+    progress(f'categories: {len(category_ids)}')
+
+    first_item = _next_id(conn, 'menu_items', 'item_id')
+    prices = [round(rng.uniform(20, 500), 2) for _ in range(volumes['menu_items'])]
+    _insert_batches(conn, '''
+        INSERT INTO menu_items (item_id, name, description, price, category_id, restaurant_id, image)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        (first_item + i, _phrase(rng, rng.randint(1, 3)).title(), _phrase(rng, rng.randint(5, 15)), price,
+         rng.choice(category_ids), rng.choice(restaurant_ids), None)
+        for i, price in enumerate(prices)
+    ), batch_size)
+    progress(f'menu_items: {len(prices)}')
+
+    first_user = _next_id(conn, 'users', 'user_id')
+    user_ids = range(first_user, first_user + volumes['users'])
+    _insert_batches(conn, '''
+        INSERT INTO users (user_id, name, email, contact, address, password, role, password_fingerprint)
+        VALUES (?, ?, ?, ?, ?, ?, 'customer', ?)
+    ''', (
+        (uid, f'Seed User {uid}', f'seed{uid}@example.test', f'09{rng.randrange(10 ** 9):09d}',
+         f'{rng.randint(1, 999)} {rng.choice(WORDS).title()} St, {rng.choice(CITIES)}', password_hash,
+         password_fingerprint)
+        for uid in user_ids
+    ), batch_size)
+    progress(f'users: {len(user_ids)}')
+
+    # Orders are built in memory a batch at a time so details, payments and
+    # deliveries can reference ids assigned here rather than read back.
+    order_id = _next_id(conn, 'orders', 'order_id')
+    payment_id = _next_id(conn, 'payments', 'payment_id')
+    delivery_id = _next_id(conn, 'delivery', 'delivery_id')
+    remaining, orders_made = volumes['order_details'], 0
+    while remaining > 0:
+        orders, details, payments, deliveries = [], [], [], []
+        while remaining > 0 and len(details) < batch_size:
+            lines = min(rng.randint(1, 5), remaining)
+            total = SHIPPING_COST
+            for _ in range(lines):
+                index = rng.randrange(len(prices))
+                quantity = rng.randint(1, 3)
+                details.append((order_id, first_item + index, quantity, prices[index], quantity * prices[index]))
+                total += quantity * prices[index]
+            placed = timestamp()
+            status = rng.choice(ORDER_STATUSES)
+            orders.append((order_id, rng.choice(user_ids), payment_id, delivery_id, round(total, 2), status, placed))
+            payments.append((payment_id, order_id, round(total, 2), 'COD', 'Pending', placed))
+            deliveries.append((delivery_id, order_id, 'Seed Driver', 'Delivered' if status == 'Delivered' else 'Pending',
+                               placed))
+            order_id, payment_id, delivery_id = order_id + 1, payment_id + 1, delivery_id + 1
+            remaining -= lines
+        with transaction(conn):
+            conn.executemany('''
+                INSERT INTO orders (order_id, user_id, payment_id, delivery_id, total_amount, order_status, order_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', orders)
+            conn.executemany('''
+                INSERT INTO order_details (order_id, item_id, quantity, unit_price, subtotal)
+                VALUES (?, ?, ?, ?, ?)
+            ''', details)
+            conn.executemany('''
+                INSERT INTO payments (payment_id, order_id, amount, payment_method, payment_status, date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', payments)
+            conn.executemany('''
+                INSERT INTO delivery (delivery_id, order_id, driver_name, delivery_status, estimated_time)
+                VALUES (?, ?, ?, ?, ?)
+            ''', deliveries)
+        orders_made += len(orders)
+    progress(f'orders: {orders_made} ({volumes["order_details"]} order_details)')
+
+    _insert_batches(conn, '''
+        INSERT OR IGNORE INTO reviews (user_id, item_id, rating, comment, date) VALUES (?, ?, ?, ?, ?)
+    ''', (
+        (rng.choice(user_ids), first_item + rng.randrange(len(prices)), rng.choices((1, 2, 3, 4, 5), (1, 1, 2, 4, 5))[0],
+         _phrase(rng, rng.randint(3, 12)), timestamp())
+        for _ in range(volumes['reviews'])
+    ), batch_size)
+    with transaction(conn):
+        conn.execute(REVIEW_STATS_BACKFILL)
+    progress(f'reviews: {volumes["reviews"]} (duplicates skipped)')
+
+    _insert_batches(conn, 'INSERT OR IGNORE INTO cart (user_id, item_id, quantity) VALUES (?, ?, ?)', (
+        (rng.choice(user_ids), first_item + rng.randrange(len(prices)), rng.randint(1, 3))
+        for _ in range(volumes['cart'])
+    ), batch_size)
+    progress(f'cart: {volumes["cart"]} (duplicates skipped)')
+
+    first_driver = _next_id(conn, 'drivers', 'driver_id')
+    driver_ids = range(first_driver, first_driver + volumes.get('drivers', 0))
+    _insert_batches(conn, '''
+        INSERT INTO drivers (driver_id, name, latitude, longitude, status, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+    ''', (
+        (did, f'Seed Driver {did}', *_near(geo, geo.choice(CITIES)), 'available', timestamp())
+        for did in driver_ids
+    ), batch_size)
+    progress(f'drivers: {len(driver_ids)}')